@@ -0,0 +1,94 @@
+''' Archival of old expenses.
+
+    Expenses from before a horizon year can be moved out of the 'expenses' table into one
+    archive table per year (expenses_archive_2019 and so on, listed in 'expense_archives'). The
+    hot table and its indexes then only hold recent years, and reads that don't ask for older
+    dates never open the archives. Archived expenses keep their ids and still count in the
+    summary tables, and editing one moves it back into 'expenses'. '''
+
+import os
+from database import archive_table, archived_years, create_archive_table
+
+''' Returns the first date after the archived years, as yyyy-mm-dd, or None if nothing is archived.
+    Every expense from this date on is in the 'expenses' table. '''
+def archive_horizon(c):
+    row = c.execute("SELECT MAX(year) FROM expense_archives").fetchone()
+    return None if row[0] is None else f"{row[0] + 1:04d}-01-01"
+
+''' Returns the archive tables for the years between two yyyy-mm-dd dates, either of which may be None. '''
+def archive_tables_between(c, date_from, date_to):
+    return [
+        archive_table(year) for year in archived_years(c)
+        if (date_from is None or year >= int(date_from[:4])) and (date_to is None or year <= int(date_to[:4]))
+    ]
+
+''' Moves every expense dated before a year into the archive table for its year.
+
+    :param c: A cursor inside the transaction to archive in.
+    :param before_year: The first year to keep in 'expenses'.
+    :return: Dict of year: number of expenses archived. '''
+def archive_expenses(c, before_year):
+    c.execute(
+        "SELECT DISTINCT CAST(substr(date, 1, 4) AS INTEGER) FROM expenses "
+        "WHERE date < ? AND date GLOB '[0-9][0-9][0-9][0-9]-*' ORDER BY 1",
+        (f"{before_year:04d}-01-01",)
+    )
+    archived = {}
+    for year in [row[0] for row in c.fetchall()]:
+        create_archive_table(c, year)
+        bounds = (f"{year:04d}-01-01", f"{year + 1:04d}-01-01")
+        # The archive table's insert trigger adds each expense back to the summaries that the
+        # delete from 'expenses' takes it out of, so the totals don't change.
+        c.execute(
+            f"INSERT INTO {archive_table(year)} (id, user_id, name, cost_cents, date, description) "
+            "SELECT id, user_id, name, cost_cents, date, description FROM expenses WHERE date >= ? AND date < ?",
+            bounds
+        )
+        archived[year] = c.rowcount
+        c.execute("DELETE FROM expenses WHERE date >= ? AND date < ?", bounds)
+    return archived
+
+''' Moves an archived expense back into 'expenses', so it can be edited like a recent one.
+
+    :return: Whether the expense was found in an archive. '''
+def restore_expense(c, user_id, expense_id):
+    for year in archived_years(c):
+        table = archive_table(year)
+        c.execute(
+            "INSERT INTO expenses (id, user_id, name, cost_cents, date, description) "
+            f"SELECT id, user_id, name, cost_cents, date, description FROM {table} WHERE id=? AND user_id=?",
+            (expense_id, user_id)
+        )
+        if c.rowcount:
+            c.execute(f"DELETE FROM {table} WHERE id=?", (expense_id,))
+            return True
+    return False
+
+''' Deletes an archived expense.
+
+    :return: Whether the expense was found in an archive. '''
+def delete_archived_expense(c, user_id, expense_id):
+    for year in archived_years(c):
+        c.execute(f"DELETE FROM {archive_table(year)} WHERE id=? AND user_id=?", (expense_id, user_id))
+        if c.rowcount:
+            return True
+    return False
+
+''' Returns the size in bytes of a database file together with its write-ahead log. '''
+def database_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+''' Rewrites the database without free pages and merges the full-text index's segments.
+    VACUUM needs every other connection to be idle, so run it while the tracker is closed.
+
+    :param conn: The database connection, with no transaction open.
+    :param path: The database file, to measure.
+    :return: Tuple of (bytes before, bytes after). '''
+def compact(conn, path):
+    before = database_size(path)
+    conn.execute("INSERT INTO expenses_fts(expenses_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA optimize")
+    return before, database_size(path)
@@ -0,0 +1,424 @@
+''' Snapshot and incremental backups of the database, and restoring from them.
+
+    A backup directory holds a chain of backups, each described by a JSON manifest (NAME.manifest.json):
+    a full snapshot (NAME.db), copied with SQLite's online backup API, followed by any
+    number of incremental backups (NAME.changes.json.gz) holding only the rows changed since
+    the backup before, read from 'change_log'. Restoring copies the snapshot and replays the
+    changes in order. A full backup records per-user checksums of every expense, checked against
+    the copy as it is written, and an incremental one the count and total of each user it
+    changes; a restore is checked against the newest of these for every user.
+
+    Backups read the database inside one read transaction, which under WAL sees a fixed
+    snapshot while the tracker keeps writing, and copy it a few pages per step, so they can
+    run while the tracker is open. Restoring replaces the database and must not. '''
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from PyQt5.QtCore import QObject, pyqtSignal
+from database import archive_table, archived_years, connect, create_archive_table, retry_busy
+
+# Pages copied per backup step; at the default 4 KiB page size, 4 MiB.
+PAGES_PER_STEP = 1024
+# Manifests are told apart from other JSON files in the directory by their suffix and format key.
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_FORMAT = "expense-tracker-backup/1"
+MANIFEST_KEYS = ("name", "kind", "file", "created", "schema_version", "base_seq", "seq", "checksums")
+
+''' Raised when a backup can't be taken, verified or restored. '''
+class BackupError(Exception):
+    pass
+
+''' Returns per-user checksums of every expense, archived ones included, as a dict of
+    user ID (as a string, as in JSON): {"expenses": count, "total_cents": sum, "sha256": digest}.
+    This reads every row, so only full backups and verification call it. '''
+def user_checksums(conn):
+    tables = ["expenses"] + [archive_table(year) for year in archived_years(conn)]
+    union = " UNION ALL ".join(
+        f"SELECT id, user_id, name, cost_cents, date, description FROM {table}" for table in tables
+    )
+    sums = {}
+    for row in conn.execute(f"SELECT * FROM ({union}) ORDER BY user_id, id"):
+        entry = sums.get(row[1])
+        if entry is None:
+            entry = sums[row[1]] = [0, 0, hashlib.sha256()]
+        entry[0] += 1
+        entry[1] += row[3]
+        entry[2].update(json.dumps(row).encode("utf-8") + b"\n")
+    return {
+        str(user_id): {"expenses": count, "total_cents": total, "sha256": digest.hexdigest()}
+        for user_id, (count, total, digest) in sums.items()
+    }
+
+''' Returns the number and total cost of some users' expenses from the monthly summary table,
+    in O(months), in the same form as user_checksums() but without the digest. '''
+def user_totals(conn, user_ids):
+    totals = {str(user_id): {"expenses": 0, "total_cents": 0} for user_id in user_ids}
+    for user_id, count, total in conn.execute(
+        "SELECT user_id, SUM(expense_count), SUM(total_cents) FROM expense_monthly_totals "
+        f"WHERE user_id IN ({', '.join('?' for _ in user_ids)}) GROUP BY user_id",
+        list(user_ids)
+    ):
+        totals[str(user_id)] = {"expenses": count, "total_cents": total}
+    return totals
+
+''' Returns whether user_checksums() agree with the checksums or totals recorded for each user.
+    Users recorded without expenses must have none. '''
+def _checksums_match(actual, expected):
+    users = {user_id for user_id, sums in expected.items() if sums["expenses"]}
+    return set(actual) == users and all(
+        actual[user_id][key] == value for user_id in users for key, value in expected[user_id].items()
+    )
+
+''' Raises BackupError unless PRAGMA integrity_check passes. '''
+def check_integrity(conn):
+    result = [row[0] for row in conn.execute("PRAGMA integrity_check").fetchall()]
+    if result != ["ok"]:
+        raise BackupError("Integrity check failed: " + "; ".join(result[:5]))
+
+''' Reads a manifest file.
+
+    :raises BackupError: If it isn't a readable backup manifest. '''
+def read_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BackupError(f"Can't read the backup manifest {os.path.basename(path)}: {e}")
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        raise BackupError(f"{os.path.basename(path)} isn't a backup manifest.")
+    missing = [key for key in MANIFEST_KEYS if key not in manifest]
+    if missing or manifest["kind"] not in ("full", "incremental"):
+        raise BackupError(f"The backup manifest {os.path.basename(path)} is damaged.")
+    return manifest
+
+''' Returns the manifests in a backup directory, oldest first. Other files are ignored, so
+    backups can go into a folder that holds other things too.
+
+    :raises BackupError: If a manifest can't be read. '''
+def list_backups(directory):
+    paths = glob.glob(os.path.join(glob.escape(directory), "*" + MANIFEST_SUFFIX))
+    manifests = [read_manifest(path) for path in paths]
+    # A backup with no changes since the one before ends at the same change, so ties go by time.
+    return sorted(manifests, key=lambda m: (m["seq"], m["created"], m["kind"] != "full"))
+
+''' Adapts a progress(pages_left, total_pages) callback to Connection.backup()'s. '''
+def _step_callback(progress):
+    if progress is None:
+        return None
+    return lambda status, left, total: progress(left, total)
+
+def _last_seq(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='change_log'").fetchone()
+    return row[0] if row else 0
+
+def _new_name(directory, kind):
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    name, number = f"{stamp}-{kind}", 1
+    while glob.glob(os.path.join(glob.escape(directory), name + ".*")):
+        number += 1
+        name = f"{stamp}-{kind}-{number}"
+    return name
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, manifest["name"] + MANIFEST_SUFFIX)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+''' Starts the change log if it isn't running, and drops the changes a backup now covers. '''
+def _prune_log(db_path, seq):
+    conn = connect(db_path)
+    try:
+        def prune():
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR IGNORE INTO change_log_state (id, pruned_seq) VALUES (1, 0)")
+                if seq is not None:
+                    conn.execute("DELETE FROM change_log WHERE seq <= ?", (seq,))
+                    conn.execute("UPDATE change_log_state SET pruned_seq = MAX(pruned_seq, ?)", (seq,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        retry_busy(prune)
+    finally:
+        conn.close()
+
+''' Copies the whole database into a new snapshot in a backup directory, verifies the copy and
+    returns its manifest.
+
+    :param progress: Called as progress(pages_left, total_pages) after each step. An exception
+        raised from it abandons the backup.
+    :param pages: Pages copied per step. '''
+def full_backup(db_path, directory, progress=None, pages=PAGES_PER_STEP):
+    os.makedirs(directory, exist_ok=True)
+    # Changes are logged from before the snapshot is read, so none fall between it and the next backup.
+    _prune_log(db_path, None)
+    name = _new_name(directory, "full")
+    path = os.path.join(directory, name + ".db")
+    source = connect(db_path, read_only=True)
+    target = sqlite3.connect(path + ".tmp")
+    try:
+        # Holding a read transaction pins the snapshot, so writes made during the copy neither
+        # end up in it nor make the backup start over.
+        source.execute("BEGIN")
+        seq = _last_seq(source)
+        schema_version = source.execute("PRAGMA user_version").fetchone()[0]
+        checksums = user_checksums(source)
+        source.backup(target, pages=pages, progress=_step_callback(progress))
+        source.rollback()
+        # A snapshot should be one self-contained file.
+        target.execute("PRAGMA journal_mode=DELETE")
+        check_integrity(target)
+        if user_checksums(target) != checksums:
+            raise BackupError("The copied expenses don't match the database.")
+        target.close()
+        os.replace(path + ".tmp", path)
+    except BaseException:
+        target.close()
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+        raise
+    finally:
+        source.close()
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "name": name,
+        "kind": "full",
+        "file": name + ".db",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "schema_version": schema_version,
+        "base_seq": None,
+        "seq": seq,
+        "checksums": checksums,
+    }
+    _write_manifest(directory, manifest)
+    _prune_log(db_path, seq)
+    return manifest
+
+''' Writes the rows changed since the newest backup in a directory to a new incremental backup
+    and returns its manifest. Only the changed rows are read, and for the users they belong to,
+    the totals from the summary tables.
+
+    :raises BackupError: If there is no earlier backup to continue from, or its changes are no
+        longer all in the log, in which case a full backup is needed. '''
+def incremental_backup(db_path, directory):
+    backups = list_backups(directory)
+    if not backups:
+        raise BackupError("There is no full backup to continue from.")
+    base = backups[-1]
+    source = connect(db_path, read_only=True)
+    try:
+        source.execute("BEGIN")
+        state = source.execute("SELECT pruned_seq FROM change_log_state").fetchone()
+        if state is None or state[0] > base["seq"]:
+            raise BackupError("Changes since the last backup in this directory are no longer logged.")
+        if source.execute("PRAGMA user_version").fetchone()[0] != base["schema_version"]:
+            raise BackupError("The database has been upgraded since the last backup.")
+        seq = _last_seq(source)
+        changed = source.execute(
+            "SELECT table_name, row_id, MAX(seq) FROM change_log WHERE seq > ? AND seq <= ? "
+            "GROUP BY table_name, row_id ORDER BY 3",
+            (base["seq"], seq)
+        ).fetchall()
+        user_ids = sorted({
+            row[0] for row in source.execute(
+                "SELECT DISTINCT user_id FROM change_log WHERE seq > ? AND seq <= ? AND user_id IS NOT NULL",
+                (base["seq"], seq)
+            )
+        })
+        columns = {}
+        changes = []
+        for table, row_id, _ in changed:
+            if table not in columns:
+                columns[table] = [row[1] for row in source.execute(f"PRAGMA table_info({table})")]
+            row = source.execute(f"SELECT * FROM {table} WHERE id=?", (row_id,)).fetchone()
+            changes.append([table, row_id, None if row is None else list(row)])
+        checksums = user_totals(source, user_ids)
+        schema_version = base["schema_version"]
+    finally:
+        source.close()
+    name = _new_name(directory, "incremental")
+    with gzip.open(os.path.join(directory, name + ".changes.json.gz"), "wt", encoding="utf-8") as f:
+        json.dump({"columns": columns, "changes": changes}, f)
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "name": name,
+        "kind": "incremental",
+        "file": name + ".changes.json.gz",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "schema_version": schema_version,
+        "base_seq": base["seq"],
+        "seq": seq,
+        "checksums": checksums,
+    }
+    _write_manifest(directory, manifest)
+    _prune_log(db_path, seq)
+    return manifest
+
+''' Takes an incremental backup if the directory has a backup to continue from, and a full one otherwise. '''
+def backup(db_path, directory, progress=None):
+    if list_backups(directory):
+        try:
+            return incremental_backup(db_path, directory)
+        except BackupError:
+            pass
+    return full_backup(db_path, directory, progress)
+
+''' Returns the manifests to restore, a full backup followed by the incremental ones after it.
+
+    :param name: The backup to restore up to, or None for the newest. '''
+def backup_chain(directory, name=None):
+    by_seq = {}
+    target = None
+    for manifest in list_backups(directory):
+        # Several backups can end at the same change; continue from a snapshot, or else the earliest.
+        seen = by_seq.get(manifest["seq"])
+        if seen is None or (manifest["kind"] == "full" and seen["kind"] != "full"):
+            by_seq[manifest["seq"]] = manifest
+        if name is None or manifest["name"] == name:
+            target = manifest
+    if target is None:
+        raise BackupError(f"No backup named {name!r}." if name else "The directory has no backups.")
+    chain = [target]
+    while chain[0]["kind"] != "full":
+        previous = by_seq.get(chain[0]["base_seq"])
+        if previous is None or previous is chain[0]:
+            raise BackupError(f"The backup before {chain[0]['name']} is missing.")
+        chain.insert(0, previous)
+    return chain
+
+def _apply_changes(conn, path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    c = conn.cursor()
+    c.execute("BEGIN")
+    try:
+        for table, row_id, values in data["changes"]:
+            if table.startswith("expenses_archive_"):
+                create_archive_table(c, int(table.rsplit("_", 1)[1]))
+            # Deleting and inserting, rather than INSERT OR REPLACE, runs the summary and search triggers.
+            c.execute(f"DELETE FROM {table} WHERE id=?", (row_id,))
+            if values is not None:
+                columns = data["columns"][table]
+                c.execute(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    values
+                )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+''' Rebuilds the database a chain of backups describes in a new file, and verifies it.
+
+    :return: The expected checksums, which the file has been checked against. '''
+def _rebuild(directory, chain, path, progress=None):
+    snapshot = connect(os.path.join(directory, chain[0]["file"]), read_only=True)
+    conn = sqlite3.connect(path)
+    try:
+        snapshot.backup(conn, pages=PAGES_PER_STEP, progress=_step_callback(progress))
+        checksums = dict(chain[0]["checksums"])
+        for manifest in chain[1:]:
+            _apply_changes(conn, os.path.join(directory, manifest["file"]))
+            checksums.update(manifest["checksums"])
+        # The restored database starts a new backup chain.
+        conn.execute("DELETE FROM change_log")
+        conn.execute("DELETE FROM change_log_state")
+        conn.commit()
+        check_integrity(conn)
+        if not _checksums_match(user_checksums(conn), checksums):
+            raise BackupError("The restored expenses don't match the checksums recorded in the backup.")
+    finally:
+        snapshot.close()
+        conn.close()
+    return checksums
+
+''' Restores the database from a backup directory, replacing its contents.
+    Close the tracker first: the database must not be in use.
+
+    :param name: The backup to restore up to, or None for the newest.
+    :return: The manifests that were restored, oldest first. '''
+def restore(directory, db_path, name=None, progress=None):
+    chain = backup_chain(directory, name)
+    path = db_path + ".restore"
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        _rebuild(directory, chain, path, progress)
+        # Copying through the backup API, instead of replacing the file, also deals with the
+        # database's write-ahead log.
+        restored = sqlite3.connect(path)
+        conn = connect(db_path)
+        try:
+            restored.backup(conn)
+        finally:
+            restored.close()
+            conn.close()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return chain
+
+''' Checks that a backup can be restored: rebuilds it in a temporary file next to the backups
+    and checks its integrity and checksums, without touching the database.
+
+    :return: The manifests that were checked, oldest first. '''
+def verify(directory, name=None):
+    chain = backup_chain(directory, name)
+    path = os.path.join(directory, ".verify.db")
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        _rebuild(directory, chain, path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return chain
+
+class _Cancelled(Exception):
+    pass
+
+''' Takes a backup on a worker thread: incremental if the directory already has one to continue
+    from, full otherwise. A full backup reports its progress in pages and can be cancelled
+    between steps. Move the worker to a QThread and connect the thread's started signal to run(). '''
+class BackupWorker(QObject):
+    progress = pyqtSignal(int, int)  # Pages copied so far, total pages.
+    finished = pyqtSignal(dict)  # The new backup's manifest.
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    """ Initializes the BackupWorker instance.
+
+        :param db_path: Path of the database file. The worker opens its own connections on its thread.
+        :param directory: The backup directory to add the backup to. """
+    def __init__(self, db_path, directory):
+        super().__init__()
+        self.db_path = db_path
+        self.directory = directory
+        self._cancel_requested = False
+
+    ''' Asks a full backup to stop after the current step. Safe to call from any thread. '''
+    def cancel(self):
+        self._cancel_requested = True
+
+    def run(self):
+        try:
+            manifest = backup(self.db_path, self.directory, self._step)
+        except _Cancelled:
+            self.cancelled.emit()
+            return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.finished.emit(manifest)
+
+    def _step(self, left, total):
+        if self._cancel_requested:
+            raise _Cancelled()
+        self.progress.emit(total - left, total)
@@ -0,0 +1,270 @@
+''' Headless benchmarks for the expense tracker.
+
+    Seeds a database with the application's schema and synthetic expenses, then times the real
+    widget code paths offscreen and prints the results as JSON:
+
+        python benchmark.py --users 10 --expenses 1000000 --output bench.json
+
+    Pass --db with --reuse to benchmark an existing seeded database without seeding it again. '''
+
+import os
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from PyQt5.QtCore import QModelIndex
+from PyQt5.QtWidgets import QApplication, QMessageBox, QFileDialog
+from database import init_db
+from db_service import DatabaseService
+from login_register import LoginRegisterWidget
+from passwords import CredentialCache, hash_password
+from dashboard import DashboardWidget
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+BENCH_PASSWORD = "benchmark"
+
+MERCHANTS = [
+    "Groceries", "Rent", "Coffee", "Gas", "Electricity", "Internet", "Phone", "Restaurant", "Movies",
+    "Pharmacy", "Gym", "Streaming", "Books", "Clothing", "Parking", "Insurance", "Taxi", "Hardware",
+]
+DESCRIPTIONS = ["", "", "", "card payment", "monthly bill", "with friends", "online order", "refund pending"]
+
+''' Yields synthetic (user_id, name, cost_cents, date, description) rows.
+    Costs are log-normal around $20, dates cover the past `years` years with more
+    expenses in recent months, and merchants follow a skewed popularity curve. '''
+def generate_expenses(users, count, years=5, seed=0):
+    rng = random.Random(seed)
+    today = date.today()
+    span = 365 * years
+    for _ in range(count):
+        days_ago = int(span * (1 - math.sqrt(rng.random())))
+        yield (
+            rng.randint(1, users),
+            MERCHANTS[min(int(rng.expovariate(0.25)), len(MERCHANTS) - 1)],
+            round(min(rng.lognormvariate(3, 1), 5000) * 100),
+            (today - timedelta(days=days_ago)).isoformat(),
+            rng.choice(DESCRIPTIONS),
+        )
+
+''' Creates a database with the application's schema and fills it with benchmark users and expenses. '''
+def seed_database(path, users, expenses, batch_size=50000):
+    conn = init_db(path)
+    c = conn.cursor()
+    password = hash_password(BENCH_PASSWORD)
+    c.executemany(
+        "INSERT INTO users (username, password) VALUES (?, ?)",
+        [(f"user{i}", password) for i in range(1, users + 1)]
+    )
+    rows = generate_expenses(users, expenses)
+    while True:
+        batch = [row for _, row in zip(range(batch_size), rows)]
+        if not batch:
+            break
+        c.executemany("INSERT INTO expenses (user_id, name, cost_cents, date, description) VALUES (?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    c.execute("ANALYZE")
+    conn.close()
+
+''' Returns latency statistics in milliseconds for a list of durations in seconds. '''
+def summarize(samples):
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "runs": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+    }
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+''' Times the dashboard and login code paths against a seeded database. '''
+class Benchmark:
+    def __init__(self, app, service, user_id, runs, export_runs, work_dir):
+        self.app = app
+        self.service = service
+        self.user_id = user_id
+        self.runs = runs
+        self.export_runs = export_runs
+        self.work_dir = work_dir
+        self.messages = []
+        # Replace modal dialogs so handlers run straight through.
+        QMessageBox.information = staticmethod(lambda *args, **kwargs: self.messages.append(args[1]))
+        QMessageBox.warning = staticmethod(lambda *args, **kwargs: self.messages.append(args[1]))
+        QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.Yes)
+        QFileDialog.getSaveFileName = staticmethod(
+            lambda *args, **kwargs: (os.path.join(self.work_dir, "export.xlsx"), "")
+        )
+        self.dashboard = DashboardWidget(service, user_id, logout_callback=lambda: None)
+        self.wait_until(self.table_loaded)
+
+    ''' Processes Qt events until a condition holds, so asynchronous work is included in the timing. '''
+    def wait_until(self, condition, timeout=600):
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Benchmark step did not finish in time")
+            self.app.processEvents()
+            time.sleep(0.0005)
+
+    def table_loaded(self):
+        return not self.dashboard.expenses_model.is_fetching()
+
+    ''' Times an action until a completion check passes.
+
+        :param action: Starts the work being measured.
+        :param done: Returns a condition that holds once that run's work has finished.
+        :param runs: Number of timed runs, defaulting to --runs. '''
+    def time_runs(self, action, done, runs=None):
+        samples = []
+        for _ in range(runs or self.runs):
+            condition = done()
+            started = time.perf_counter()
+            action()
+            self.wait_until(condition)
+            samples.append(time.perf_counter() - started)
+        return summarize(samples)
+
+    ''' Returns a condition for the next message box, which every dashboard handler shows when its work completes. '''
+    def message_shown(self):
+        expected = len(self.messages)
+        return lambda: len(self.messages) > expected
+
+    def bench_load_expenses(self):
+        return self.time_runs(self.dashboard.load_expenses, lambda: self.table_loaded)
+
+    def bench_scroll(self):
+        model = self.dashboard.expenses_model
+        self.dashboard.load_expenses()
+        self.wait_until(self.table_loaded)
+        return self.time_runs(lambda: model.fetchMore(QModelIndex()), lambda: self.table_loaded)
+
+    def fill_form(self):
+        self.dashboard.expense_name_input.setText("Benchmark")
+        self.dashboard.expense_cost_input.setText("12.34")
+        self.dashboard.description_input.setPlainText("benchmark run")
+
+    def select_first_row(self):
+        self.dashboard.load_selected_expense(self.dashboard.expenses_model.index(0, 0))
+
+    def bench_add_expense(self):
+        def add():
+            self.fill_form()
+            self.dashboard.add_expense()
+        return self.time_runs(add, self.message_shown)
+
+    def bench_update_expense(self):
+        def update():
+            self.select_first_row()
+            self.dashboard.expense_cost_input.setText("43.21")
+            self.dashboard.update_expense()
+        return self.time_runs(update, self.message_shown)
+
+    def bench_delete_expense(self):
+        def delete():
+            self.select_first_row()
+            self.dashboard.delete_expense()
+        return self.time_runs(delete, self.message_shown)
+
+    def bench_export_expenses(self):
+        return self.time_runs(
+            self.dashboard.export_expenses, lambda: lambda: self.dashboard.export_thread is None, self.export_runs
+        )
+
+    def bench_login(self):
+        logins = []
+        widget = LoginRegisterWidget(self.service, logins.append)
+        widget.login_username_input.setText(f"user{self.user_id}")
+        widget.login_password_input.setText(BENCH_PASSWORD)
+
+        def logged_in():
+            expected = len(logins)
+            return lambda: len(logins) > expected
+
+        def login():
+            # Time the password check itself rather than a hit in the session's credential cache.
+            widget.credentials = CredentialCache()
+            widget.handle_login()
+
+        return self.time_runs(login, logged_in)
+
+    def run(self, names):
+        return {name: getattr(self, f"bench_{name}")() for name in names}
+
+BENCHMARKS = ["load_expenses", "scroll", "add_expense", "update_expense", "delete_expense", "export_expenses", "login"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the expense tracker headlessly.")
+    parser.add_argument("--db", help="Database file to use. Defaults to a temporary file.")
+    parser.add_argument("--reuse", action="store_true", help="Use --db as it is instead of seeding it.")
+    parser.add_argument("--users", type=int, default=10, help="Number of users to seed.")
+    parser.add_argument("--expenses", type=int, default=10000, help="Number of expenses to seed across all users.")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per benchmark.")
+    parser.add_argument("--export-runs", type=int, default=3, help="Timed runs of the export benchmark.")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Run only these benchmarks.")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="expense-bench-")
+    db_path = args.db or os.path.join(work_dir, "expense_tracker.db")
+    seed_seconds = None
+    if not args.reuse:
+        if os.path.exists(db_path):
+            parser.error(f"{db_path} already exists; pass --reuse to benchmark it as is.")
+        started = time.perf_counter()
+        seed_database(db_path, args.users, args.expenses)
+        seed_seconds = time.perf_counter() - started
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    service = DatabaseService(db_path)
+    try:
+        user_id = service.read(lambda conn: conn.execute(
+            "SELECT user_id FROM expenses GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()).result()
+        benchmark = Benchmark(app, service, user_id[0] if user_id else 1, args.runs, args.export_runs, work_dir)
+        results = benchmark.run(args.only or BENCHMARKS)
+        expense_count = service.read(lambda conn: conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]).result()
+    finally:
+        service.shutdown()
+
+    report = {
+        "database": db_path,
+        "users": args.users,
+        "expenses": expense_count,
+        "seed_seconds": seed_seconds,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "peak_rss_kb": peak_rss_kb(),
+        "benchmarks": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,62 @@
 from PyQt5.QtWidgets import (
     QWidget, QLabel, QVBoxLayout, QHBoxLayout, QFormLayout, QLineEdit,
-    QPushButton, QTextEdit, QTableWidget, QTableWidgetItem, QDateEdit,
-    QFileDialog, QMessageBox
+    QPushButton, QTextEdit, QTableView, QAbstractItemView, QDateEdit,
+    QFileDialog, QMessageBox, QProgressDialog
 )
-from PyQt5.QtCore import QDate, Qt
-from openpyxl import Workbook
-from datetime import datetime
+from PyQt5.QtCore import QDate, Qt, QThread, QTimer
+from PyQt5.QtGui import QDoubleValidator
+from expense_model import ExpenseTableModel
+from expense_query import ExpenseFilter
+from repository import ExpenseRepository, DATE_COLUMN
+from archive import delete_archived_expense, restore_expense
+from backup import BackupWorker
+from export import ExportWorker
+from importer import ImportWorker
+from summary import SummaryDialog
+from recurring import RecurringDialog
+from money import parse_cents, cents_to_text
+from formatting import display_cents, iso_to_qdate
+from profiling import timed
 
-''' A widget that provides a dashboard for users to manage their expenses. '''
+''' Inserts an expense and returns its new id and whether it matches the table's filter.
+    Runs on the database writer thread. '''
+def _insert_expense(conn, user_id, name, cost_cents, date_str, description, expense_filter):
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO expenses (user_id, name, cost_cents, date, description) VALUES (?, ?, ?, ?, ?)",
+        (user_id, name, cost_cents, date_str, description)
+    )
+    return c.lastrowid, ExpenseRepository(user_id, expense_filter).matches(conn, c.lastrowid)
+
+''' Updates an expense and returns whether it still matches the table's filter.
+    Runs on the database writer thread. '''
+def _update_expense(conn, user_id, expense_id, name, cost_cents, date_str, description, expense_filter):
+    c = conn.cursor()
+    c.execute(
+        "UPDATE expenses SET name=?, cost_cents=?, date=?, description=? WHERE id=? AND user_id=?",
+        (name, cost_cents, date_str, description, expense_id, user_id)
+    )
+    # An archived expense is moved back into 'expenses' before it is changed.
+    if c.rowcount == 0 and restore_expense(c, user_id, expense_id):
+        c.execute(
+            "UPDATE expenses SET name=?, cost_cents=?, date=?, description=? WHERE id=? AND user_id=?",
+            (name, cost_cents, date_str, description, expense_id, user_id)
+        )
+    return ExpenseRepository(user_id, expense_filter).matches(conn, expense_id)
+
+''' Deletes an expense, from its archive table if it has been archived. Runs on the database writer thread. '''
+def _delete_expense(conn, user_id, expense_id):
+    c = conn.cursor()
+    c.execute("DELETE FROM expenses WHERE id=? AND user_id=?", (expense_id, user_id))
+    if c.rowcount == 0:
+        delete_archived_expense(c, user_id, expense_id)
+
+''' A widget that provides a dashboard for users to manage their expenses.
+    All database work goes through the DatabaseService, so the GUI thread never waits on SQLite.
+    It can be built before anyone logs in, with no user, and re-bound with set_user() on each
+    login and logout instead of being rebuilt. '''
 class DashboardWidget(QWidget):
-    def __init__(self, conn, user_id, logout_callback):
+    def __init__(self, service, user_id, logout_callback):
         super().__init__()
         self.logout_button = None
         self.expense_name_input = None
@@ -21,12 +68,36 @@ class DashboardWidget(QWidget):
         self.delete_expense_button = None
         self.export_button = None
         self.expenses_table = None
-        self.conn = conn
+        self.expenses_model = None
+        self.totals_label = None
+        self.search_input = None
+        self.date_from_input = None
+        self.date_to_input = None
+        self.min_cost_input = None
+        self.max_cost_input = None
+        self.clear_search_button = None
+        self.search_timer = None
+        self.export_thread = None
+        self.export_worker = None
+        self.export_progress = None
+        self.import_button = None
+        self.import_thread = None
+        self.import_worker = None
+        self.import_progress = None
+        self.summary_button = None
+        self.recurring_button = None
+        self.backup_button = None
+        self.backup_thread = None
+        self.backup_worker = None
+        self.backup_progress = None
+        self.service = service
         self.user_id = user_id
         self.selected_expense_id = None  # To track the selected expense.
+        self.selected_expense = None  # The selected expense's row as loaded in the table.
         self.logout_callback = logout_callback
         self.init_ui()
-        self.load_expenses()
+        if user_id is not None:
+            self.load_expenses()
 
     ''' Initializes the user interface of the widget, including the form layout and expense table. '''
     def init_ui(self):
@@ -63,57 +134,170 @@ class DashboardWidget(QWidget):
         self.delete_expense_button.setEnabled(False)
         self.export_button = QPushButton("Export as Excel Sheet")
         self.export_button.clicked.connect(self.export_expenses)
+        self.import_button = QPushButton("Import Expenses")
+        self.import_button.clicked.connect(self.import_expenses)
+        self.summary_button = QPushButton("Summary")
+        self.summary_button.clicked.connect(self.show_summary)
+        self.recurring_button = QPushButton("Recurring")
+        self.recurring_button.clicked.connect(self.show_recurring)
+        self.backup_button = QPushButton("Back Up")
+        self.backup_button.clicked.connect(self.backup_database)
 
-        # Layout for expense operations.
+        # Layout for expense operations, with the actions on all expenses on a second row.
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.add_expense_button)
         button_layout.addWidget(self.update_expense_button)
         button_layout.addWidget(self.delete_expense_button)
-        button_layout.addWidget(self.export_button)
+        tools_layout = QHBoxLayout()
+        tools_layout.addWidget(self.export_button)
+        tools_layout.addWidget(self.import_button)
+        tools_layout.addWidget(self.summary_button)
+        tools_layout.addWidget(self.recurring_button)
+        tools_layout.addWidget(self.backup_button)
+
+        # Query bar for searching and filtering expenses.
+        search_layout = self.init_search_bar()
 
         # Table to display expenses.
-        self.expenses_table = QTableWidget()
-        self.expenses_table.setColumnCount(5)
-        self.expenses_table.setHorizontalHeaderLabels(["ID", "Name", "Cost", "Date", "Description"])
-        self.expenses_table.cellClicked.connect(self.load_selected_expense)
+        self.expenses_model = ExpenseTableModel(self.service, self.user_id, self)
+        self.expenses_table = QTableView()
+        self.expenses_table.setModel(self.expenses_model)
+        self.expenses_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.expenses_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.expenses_table.clicked.connect(self.load_selected_expense)
+        self.expenses_table.horizontalHeader().setSortIndicator(DATE_COLUMN, Qt.AscendingOrder)
+        self.expenses_table.setSortingEnabled(True)
+        self.totals_label = QLabel()
+        self.expenses_model.totals_changed.connect(self.update_totals_label)
 
         # Assemble dashboard layout
         main_layout.addLayout(form_layout)
         main_layout.addLayout(button_layout)
+        main_layout.addLayout(tools_layout)
         main_layout.addWidget(QLabel("Your Expenses:"))
+        main_layout.addLayout(search_layout)
         main_layout.addWidget(self.expenses_table)
+        main_layout.addWidget(self.totals_label)
         self.setLayout(main_layout)
 
+    ''' Builds the query bar of text, date range and cost range filters and returns its layout.
+        Edits restart a short timer, so a query only runs once typing pauses and a query
+        superseded by the next keystroke is never issued. '''
+    def init_search_bar(self):
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.apply_search)
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search name or description")
+        self.search_input.textChanged.connect(self.search_timer.start)
+        self.date_from_input = self.create_filter_date_edit()
+        self.date_to_input = self.create_filter_date_edit()
+        self.min_cost_input = self.create_filter_cost_edit("Min cost")
+        self.max_cost_input = self.create_filter_cost_edit("Max cost")
+        self.clear_search_button = QPushButton("Clear")
+        self.clear_search_button.clicked.connect(self.clear_search)
+
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.search_input)
+        search_layout.addWidget(QLabel("From:"))
+        search_layout.addWidget(self.date_from_input)
+        search_layout.addWidget(QLabel("To:"))
+        search_layout.addWidget(self.date_to_input)
+        search_layout.addWidget(self.min_cost_input)
+        search_layout.addWidget(self.max_cost_input)
+        search_layout.addWidget(self.clear_search_button)
+        return search_layout
+
+    ''' Creates a date filter input whose minimum date is shown as "Any" and means no bound. '''
+    def create_filter_date_edit(self):
+        date_edit = QDateEdit(calendarPopup=True)
+        date_edit.setMinimumDate(QDate(1900, 1, 1))
+        date_edit.setSpecialValueText("Any")
+        date_edit.setDate(date_edit.minimumDate())
+        date_edit.dateChanged.connect(self.search_timer.start)
+        return date_edit
+
+    def create_filter_cost_edit(self, placeholder):
+        cost_edit = QLineEdit()
+        cost_edit.setPlaceholderText(placeholder)
+        cost_edit.setValidator(QDoubleValidator(0, 1e12, 2, cost_edit))
+        cost_edit.setMaximumWidth(80)
+        cost_edit.textChanged.connect(self.search_timer.start)
+        return cost_edit
+
+    ''' Builds a filter from the query bar and shows the matching expenses.
+        The selected row may no longer be shown, so a changed filter drops the selection,
+        but anything typed into the form is kept. '''
+    @timed("dashboard.apply_search")
+    def apply_search(self):
+        changed = self.expenses_model.set_filter(ExpenseFilter(
+            text=self.search_input.text(),
+            date_from=self.filter_date(self.date_from_input),
+            date_to=self.filter_date(self.date_to_input),
+            min_cents=self.filter_cost(self.min_cost_input),
+            max_cents=self.filter_cost(self.max_cost_input),
+        ))
+        if changed:
+            self.clear_selection()
+
+    def filter_date(self, date_edit):
+        if date_edit.date() == date_edit.minimumDate():
+            return None
+        return date_edit.date().toString("yyyy-MM-dd")
+
+    def filter_cost(self, cost_edit):
+        try:
+            return parse_cents(cost_edit.text())
+        except ValueError:
+            return None
+
+    ''' Resets every filter in the query bar and shows all expenses. '''
+    def clear_search(self):
+        self.reset_search_bar()
+        self.apply_search()
+
+    def reset_search_bar(self):
+        self.search_input.clear()
+        self.date_from_input.setDate(self.date_from_input.minimumDate())
+        self.date_to_input.setDate(self.date_to_input.minimumDate())
+        self.min_cost_input.clear()
+        self.max_cost_input.clear()
+
+    ''' Switches the dashboard to another user, resetting the form and the query bar.
+
+        :param user_id: The ID of the logged-in user, or None on logout to empty the table. '''
+    @timed("dashboard.set_user")
+    def set_user(self, user_id):
+        self.user_id = user_id
+        self.reset_search_bar()
+        # The model is re-bound with an empty filter below, so skip the debounced search.
+        self.search_timer.stop()
+        self.clear_form()
+        self.expenses_table.clearSelection()
+        self.expenses_model.set_user(user_id)
+
     '''  Handles the logout event by calling the provided logout_callback function. '''
     def handle_logout(self):
         self.logout_callback()
 
-    ''' Retrieves expenses from the database and populates the expense table. '''
+    ''' Reloads the expense table. Rows are fetched from the database page by page as the table scrolls. '''
+    @timed("dashboard.load_expenses")
     def load_expenses(self):
-        c = self.conn.cursor()
-        c.execute("SELECT id, name, cost, date, description FROM expenses WHERE user_id=?", (self.user_id,))
-        rows = c.fetchall()
-        self.expenses_table.setRowCount(0)
-        for row_data in rows:
-            row_number = self.expenses_table.rowCount()
-            self.expenses_table.insertRow(row_number)
-            for col, data in enumerate(row_data):
-                # Cost column: add a dollar sign.
-                if col == 2:
-                    display_data = "$" + str(data)
-                # Date column: reformat from yyyy-MM-dd to "Month day, Year".
-                elif col == 3:
-                    qdate = QDate.fromString(data, "yyyy-MM-dd")
-                    display_data = qdate.toString("MMMM d, yyyy") if qdate.isValid() else str(data)
-                else:
-                    display_data = str(data)
-                self.expenses_table.setItem(row_number, col, QTableWidgetItem(display_data))
+        self.expenses_model.reload()
         self.expenses_table.clearSelection()
         self.selected_expense_id = None
+        self.selected_expense = None
         self.update_expense_button.setEnabled(False)
         self.delete_expense_button.setEnabled(False)
 
+    ''' Shows the number of expenses and their total cost below the table. '''
+    def update_totals_label(self, count, total):
+        self.totals_label.setText(f"{count} expenses, total {display_cents(total)}")
+
     ''' Adds a new expense to the database.'''
+    @timed("dashboard.add_expense")
     def add_expense(self):
         name = self.expense_name_input.text().strip()
         cost_text = self.expense_cost_input.text().strip()
@@ -123,37 +307,46 @@ class DashboardWidget(QWidget):
             QMessageBox.warning(self, "Input Error", "Please enter both expense name and cost!")
             return
         try:
-            cost = float(cost_text)
+            cost_cents = parse_cents(cost_text)
         except ValueError:
             QMessageBox.warning(self, "Input Error", "Cost must be a number!")
             return
-        c = self.conn.cursor()
-        c.execute(
-            "INSERT INTO expenses (user_id, name, cost, date, description) VALUES (?, ?, ?, ?, ?)",
-            (self.user_id, name, cost, date_str, description)
+        expense_filter = self.expenses_model.expense_filter
+        self.service.write(
+            _insert_expense, self.user_id, name, cost_cents, date_str, description, expense_filter,
+            callback=lambda result: self.expense_added(
+                (result[0], name, cost_cents, date_str, description), expense_filter, result[1]
+            ),
+            error_callback=self.write_failed
         )
-        self.conn.commit()
+
+    @timed("dashboard.expense_added")
+    def expense_added(self, row, expense_filter, matches):
+        if expense_filter is self.expenses_model.expense_filter:
+            self.expenses_model.insert_expense(row, matches)
+        else:
+            self.load_expenses()
         QMessageBox.information(self, "Success", "Expense added successfully!")
         self.clear_form()
-        self.load_expenses()
 
     ''' Loads the user selected expense's details into the form for editing. '''
-    def load_selected_expense(self, row, column):
-        expense_id_item = self.expenses_table.item(row, 0)
-        if not expense_id_item:
+    @timed("dashboard.load_selected_expense")
+    def load_selected_expense(self, index):
+        if not index.isValid():
             return
-        self.selected_expense_id = int(expense_id_item.text())
-        self.expense_name_input.setText(self.expenses_table.item(row, 1).text())
-        cost_text = self.expenses_table.item(row, 2).text().lstrip("$")
-        self.expense_cost_input.setText(cost_text)
-        date_text = self.expenses_table.item(row, 3).text()
-        qdate = QDate.fromString(date_text, "MMMM d, yyyy")
+        expense_id, name, cost_cents, date_str, description = self.expenses_model.row_at(index.row())
+        self.selected_expense_id = expense_id
+        self.selected_expense = self.expenses_model.row_at(index.row())
+        self.expense_name_input.setText(name)
+        self.expense_cost_input.setText(cents_to_text(cost_cents))
+        qdate = iso_to_qdate(date_str)
         self.expense_date_input.setDate(qdate if qdate.isValid() else QDate.currentDate())
-        self.description_input.setPlainText(self.expenses_table.item(row, 4).text())
+        self.description_input.setPlainText(description or "")
         self.update_expense_button.setEnabled(True)
         self.delete_expense_button.setEnabled(True)
 
     ''' Updates the selected expense in the database as well as updates the table. '''
+    @timed("dashboard.update_expense")
     def update_expense(self):
         if not self.selected_expense_id:
             QMessageBox.warning(self, "Selection Error", "No expense selected for update!")
@@ -166,21 +359,31 @@ class DashboardWidget(QWidget):
             QMessageBox.warning(self, "Input Error", "Please enter both expense name and cost!")
             return
         try:
-            cost = float(cost_text)
+            cost_cents = parse_cents(cost_text)
         except ValueError:
             QMessageBox.warning(self, "Input Error", "Cost must be a number!")
             return
-        c = self.conn.cursor()
-        c.execute(
-            "UPDATE expenses SET name=?, cost=?, date=?, description=? WHERE id=? AND user_id=?",
-            (name, cost, date_str, description, self.selected_expense_id, self.user_id)
+        old_row = self.selected_expense
+        new_row = (self.selected_expense_id, name, cost_cents, date_str, description)
+        expense_filter = self.expenses_model.expense_filter
+        self.service.write(
+            _update_expense, self.user_id, *new_row, expense_filter,
+            callback=lambda matches: self.expense_updated(old_row, new_row, expense_filter, matches),
+            error_callback=self.write_failed
         )
-        self.conn.commit()
+
+    @timed("dashboard.expense_updated")
+    def expense_updated(self, old_row, new_row, expense_filter, matches):
+        if expense_filter is self.expenses_model.expense_filter:
+            self.expenses_model.update_expense(old_row, new_row, matches)
+        else:
+            self.load_expenses()
         QMessageBox.information(self, "Success", "Expense updated successfully!")
+        self.expenses_table.clearSelection()
         self.clear_form()
-        self.load_expenses()
 
     ''' Deletes the selected expense from the database as well as updates the table. '''
+    @timed("dashboard.delete_expense")
     def delete_expense(self):
         if not self.selected_expense_id:
             QMessageBox.warning(self, "Selection Error", "No expense selected for deletion!")
@@ -191,39 +394,206 @@ class DashboardWidget(QWidget):
         )
         if confirm != QMessageBox.Yes:
             return
-        c = self.conn.cursor()
-        c.execute("DELETE FROM expenses WHERE id=? AND user_id=?", (self.selected_expense_id, self.user_id))
-        self.conn.commit()
+        old_row = self.selected_expense
+        expense_filter = self.expenses_model.expense_filter
+        self.service.write(
+            _delete_expense, self.user_id, self.selected_expense_id,
+            callback=lambda result: self.expense_deleted(old_row, expense_filter),
+            error_callback=self.write_failed
+        )
+
+    @timed("dashboard.expense_deleted")
+    def expense_deleted(self, old_row, expense_filter):
+        if expense_filter is self.expenses_model.expense_filter:
+            self.expenses_model.remove_expense(old_row)
+        else:
+            self.load_expenses()
         QMessageBox.information(self, "Success", "Expense deleted successfully!")
+        self.expenses_table.clearSelection()
         self.clear_form()
-        self.load_expenses()
 
-    '''  Exports the expenses to an Excel file. '''
+    def write_failed(self, error):
+        QMessageBox.warning(self, "Database Error", f"An error occurred: {error}")
+
+    ''' Backs up the database to a directory on a background thread, incrementally if the directory
+        already holds a backup. The copy is read from a snapshot, so expenses can still be changed meanwhile. '''
+    @timed("dashboard.backup_database")
+    def backup_database(self):
+        if self.backup_thread is not None:
+            return
+        directory = QFileDialog.getExistingDirectory(self, "Backup Folder")
+        if not directory:
+            return
+        self.backup_progress = QProgressDialog("Backing up...", "Cancel", 0, 0, self)
+        self.backup_progress.setMinimumDuration(500)
+        self.backup_thread = QThread(self)
+        self.backup_worker = BackupWorker(self.service.path, directory)
+        self.backup_worker.moveToThread(self.backup_thread)
+        self.backup_thread.started.connect(self.backup_worker.run)
+        self.backup_worker.progress.connect(self.update_backup_progress)
+        self.backup_worker.finished.connect(self.backup_finished)
+        self.backup_worker.failed.connect(self.backup_failed)
+        self.backup_worker.cancelled.connect(self.end_backup)
+        self.backup_progress.canceled.connect(self.backup_worker.cancel, Qt.DirectConnection)
+        self.backup_button.setEnabled(False)
+        self.backup_thread.start()
+
+    def update_backup_progress(self, copied, total):
+        self.backup_progress.setMaximum(total)
+        self.backup_progress.setValue(copied)
+
+    def backup_finished(self, manifest):
+        self.end_backup()
+        kind = "Full" if manifest["kind"] == "full" else "Incremental"
+        QMessageBox.information(self, "Backup Complete", f"{kind} backup {manifest['name']} written and verified.")
+
+    def backup_failed(self, message):
+        self.end_backup()
+        QMessageBox.warning(self, "Backup Error", f"An error occurred: {message}")
+
+    ''' Stops the backup thread and releases the worker and progress dialog. '''
+    def end_backup(self):
+        self.backup_thread.quit()
+        self.backup_thread.wait()
+        self.backup_progress.close()
+        self.backup_worker.deleteLater()
+        self.backup_thread.deleteLater()
+        self.backup_progress.deleteLater()
+        self.backup_worker = None
+        self.backup_thread = None
+        self.backup_progress = None
+        self.backup_button.setEnabled(True)
+
+    '''  Exports the expenses to an Excel file on a background thread, showing progress with a cancel button. '''
+    @timed("dashboard.export_expenses")
     def export_expenses(self):
+        if self.export_thread is not None:
+            return
         file_path, _ = QFileDialog.getSaveFileName(self, "Save File", "", "Excel Files (*.xlsx)")
         if not file_path:
             return
-        c = self.conn.cursor()
-        c.execute("SELECT id, name, cost, date, description FROM expenses WHERE user_id=?", (self.user_id,))
-        rows = c.fetchall()
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Expenses"
-        # Write header row.
-        ws.append(["ID", "Name", "Cost", "Date", "Description"])
-        for row in rows:
-            expense_id, name, cost, exp_date, desc = row
-            try:
-                dt = datetime.strptime(exp_date, "%Y-%m-%d")
-                formatted_date = f"{dt.strftime('%B')} {dt.day}, {dt.strftime('%Y')}"
-            except Exception:
-                formatted_date = exp_date
-            ws.append([expense_id, name, "$" + str(cost), formatted_date, desc])
-        try:
-            wb.save(file_path)
-            QMessageBox.information(self, "Export Complete", "Expenses exported successfully!")
-        except Exception as e:
-            QMessageBox.warning(self, "Export Error", f"An error occurred: {e}")
+        self.export_progress = QProgressDialog("Exporting expenses...", "Cancel", 0, 0, self)
+        self.export_progress.setWindowModality(Qt.WindowModal)
+        self.export_progress.setMinimumDuration(500)
+        self.export_thread = QThread(self)
+        self.export_worker = ExportWorker(self.service.path, self.user_id, file_path)
+        self.export_worker.moveToThread(self.export_thread)
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.progress.connect(self.update_export_progress)
+        self.export_worker.finished.connect(self.export_finished)
+        self.export_worker.failed.connect(self.export_failed)
+        self.export_worker.cancelled.connect(self.end_export)
+        # The worker checks the flag between batches, so cancel it directly rather than through its thread's queue.
+        self.export_progress.canceled.connect(self.export_worker.cancel, Qt.DirectConnection)
+        self.export_button.setEnabled(False)
+        self.export_thread.start()
+
+    def update_export_progress(self, written, total):
+        self.export_progress.setMaximum(total)
+        self.export_progress.setValue(written)
+
+    def export_finished(self, written):
+        self.end_export()
+        QMessageBox.information(self, "Export Complete", "Expenses exported successfully!")
+
+    def export_failed(self, message):
+        self.end_export()
+        QMessageBox.warning(self, "Export Error", f"An error occurred: {message}")
+
+    ''' Stops the export thread and releases the worker and progress dialog. '''
+    def end_export(self):
+        self.export_thread.quit()
+        self.export_thread.wait()
+        self.export_progress.close()
+        self.export_worker.deleteLater()
+        self.export_thread.deleteLater()
+        self.export_progress.deleteLater()
+        self.export_worker = None
+        self.export_thread = None
+        self.export_progress = None
+        self.export_button.setEnabled(True)
+
+    ''' Imports expenses from a CSV, Excel or OFX file on a background thread, then reloads the table. '''
+    @timed("dashboard.import_expenses")
+    def import_expenses(self):
+        if self.import_thread is not None:
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Import File", "", "Expense Files (*.csv *.xlsx *.xlsm *.ofx *.qfx)"
+        )
+        if not file_path:
+            return
+        self.import_progress = QProgressDialog("Importing expenses...", "Cancel", 0, 0, self)
+        self.import_progress.setWindowModality(Qt.WindowModal)
+        self.import_progress.setMinimumDuration(500)
+        self.import_thread = QThread(self)
+        self.import_worker = ImportWorker(self.service.path, self.user_id, file_path)
+        self.import_worker.moveToThread(self.import_thread)
+        self.import_thread.started.connect(self.import_worker.run)
+        self.import_worker.progress.connect(self.update_import_progress)
+        self.import_worker.finished.connect(self.import_finished)
+        self.import_worker.failed.connect(self.import_failed)
+        self.import_progress.canceled.connect(self.import_worker.cancel, Qt.DirectConnection)
+        self.import_button.setEnabled(False)
+        self.import_thread.start()
+
+    def update_import_progress(self, processed):
+        self.import_progress.setLabelText(f"Importing expenses... {processed} rows read")
+
+    @timed("dashboard.import_finished")
+    def import_finished(self, inserted, duplicates, invalid, credits, negative, seconds):
+        self.end_import()
+        self.load_expenses()
+        rate = (inserted + duplicates + invalid + credits) / seconds if seconds > 0 else 0
+        message = (
+            f"Imported {inserted} expenses ({rate:,.0f} rows/second).\n"
+            f"Skipped {duplicates} duplicates, {credits} credits and {invalid} invalid rows."
+        )
+        if negative:
+            message += (
+                f"\nThe file had {negative} rows with negative amounts, which were read as spending. "
+                "Delete any imported ones that are refunds or deposits."
+            )
+        QMessageBox.information(self, "Import Complete", message)
+
+    def import_failed(self, message):
+        self.end_import()
+        self.load_expenses()
+        QMessageBox.warning(self, "Import Error", f"An error occurred: {message}")
+
+    ''' Stops the import thread and releases the worker and progress dialog. '''
+    def end_import(self):
+        self.import_thread.quit()
+        self.import_thread.wait()
+        self.import_progress.close()
+        self.import_worker.deleteLater()
+        self.import_thread.deleteLater()
+        self.import_progress.deleteLater()
+        self.import_worker = None
+        self.import_thread = None
+        self.import_progress = None
+        self.import_button.setEnabled(True)
+
+    ''' Opens the spending summary by month and by expense name. '''
+    @timed("dashboard.show_summary")
+    def show_summary(self):
+        dialog = SummaryDialog(self.service, self.user_id, self)
+        dialog.exec_()
+        dialog.deleteLater()
+
+    ''' Opens the user's recurring expenses. '''
+    @timed("dashboard.show_recurring")
+    def show_recurring(self):
+        dialog = RecurringDialog(self.service, self.user_id, self.recurring_materialized, self)
+        dialog.exec_()
+        dialog.deleteLater()
+
+    ''' Reloads the table if a new recurring rule added expenses for the user shown.
+
+        :param added: A dict of the number of expenses added per user ID. '''
+    def recurring_materialized(self, added):
+        if self.user_id in added:
+            self.load_expenses()
 
     ''' Clears the form and disables the update and delete buttons. '''
     def clear_form(self):
@@ -232,5 +602,14 @@ class DashboardWidget(QWidget):
         self.expense_date_input.setDate(QDate.currentDate())
         self.description_input.clear()
         self.selected_expense_id = None
+        self.selected_expense = None
+        self.update_expense_button.setEnabled(False)
+        self.delete_expense_button.setEnabled(False)
+
+    ''' Forgets the selected expense without touching the form fields. '''
+    def clear_selection(self):
+        self.selected_expense_id = None
+        self.selected_expense = None
         self.update_expense_button.setEnabled(False)
         self.delete_expense_button.setEnabled(False)
+        self.expenses_table.clearSelection()
@@ -1,14 +1,17 @@
+import random
 import sqlite3
+import time
+from pathlib import Path
+from profiling import connection_factory
 
-''' Initialize the SQLite database.
-    Creates 'users' and 'expenses' tables if they don't exist. '''
-def init_db():
+# Path of the SQLite database file used by the application.
+DB_PATH = "expense_tracker.db"
+# Seconds a statement waits for another connection or process to release a lock before failing.
+BUSY_TIMEOUT = 5.0
 
-    # Connect to the SQLite database file 'expense_tracker.db'.
-    # If the file doesn't exist, it will be created.
-    # Create a cursor object to execute SQL commands.
-    conn = sqlite3.connect("expense_tracker.db")
-    c = conn.cursor()
+''' Creates the 'users' and 'expenses' tables if they don't exist.
+    Databases created before schema versioning already have them, so this is a no-op for them. '''
+def _create_base_tables(c):
 
     # Create the 'users' table if it doesn't exist.
     # The table has the following columns:
@@ -23,7 +26,6 @@ def init_db():
         )
     """)
 
-
     # Create the 'expenses' table if it doesn't exist.
     # The table has the following columns:
     # - id (primary key, auto-incrementing integer)
@@ -44,6 +46,377 @@ def init_db():
         )
     """)
 
-    # Commit changes and close the connection.
-    conn.commit()
+''' Adds indexes so per-user reads are index range scans instead of full table scans. '''
+def _create_expense_indexes(c):
+    # The rowid is implicitly the last column of every index, so (user_id) also
+    # serves the table's id-ordered pages and (user_id, date) serves date ranges.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_id ON expenses(user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses(user_id, date)")
+    c.execute("ANALYZE")
+
+''' Creates the triggers that keep the full-text index in step with the 'expenses' table. '''
+def _create_fts_triggers(c):
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO expenses_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+            INSERT INTO expenses_fts(expenses_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF name, description ON expenses BEGIN
+            INSERT INTO expenses_fts(expenses_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO expenses_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """)
+
+''' Adds a full-text index over expense names and descriptions, kept in sync by triggers,
+    and indexes for sorting a user's expenses by name or cost. '''
+def _create_expense_search(c):
+    # External-content FTS5 table: it stores only the index and reads text from 'expenses'.
+    c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts
+        USING fts5(name, description, content='expenses', content_rowid='id')
+    """)
+    _create_fts_triggers(c)
+    c.execute("INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild')")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_name ON expenses(user_id, name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_cost ON expenses(user_id, cost)")
+    c.execute("ANALYZE")
+
+# Adds one expense row ('new' or 'old') to both summary tables, with a sign of 1 or -1.
+_SUMMARY_UPSERTS = """
+    INSERT INTO expense_monthly_totals (user_id, month, expense_count, {total})
+    VALUES ({row}.user_id, substr({row}.date, 1, 7), {sign}, {sign} * {row}.{cost})
+    ON CONFLICT (user_id, month) DO UPDATE SET
+        expense_count = expense_count + excluded.expense_count, {total} = {total} + excluded.{total};
+    INSERT INTO expense_name_totals (user_id, name, expense_count, {total})
+    VALUES ({row}.user_id, {row}.name, {sign}, {sign} * {row}.{cost})
+    ON CONFLICT (user_id, name) DO UPDATE SET
+        expense_count = expense_count + excluded.expense_count, {total} = {total} + excluded.{total};
+"""
+
+# Drops summary rows left empty after a delete or an update moved the expense elsewhere.
+_SUMMARY_CLEANUP = """
+    DELETE FROM expense_monthly_totals
+    WHERE user_id = old.user_id AND month = substr(old.date, 1, 7) AND expense_count = 0;
+    DELETE FROM expense_name_totals WHERE user_id = old.user_id AND name = old.name AND expense_count = 0;
+"""
+
+''' Creates the summary tables and the triggers maintaining them from the given expense cost column. '''
+def _create_summaries(c, cost, total, total_type):
+    c.execute(f"""
+        CREATE TABLE IF NOT EXISTS expense_monthly_totals (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            expense_count INTEGER NOT NULL,
+            {total} {total_type} NOT NULL,
+            PRIMARY KEY (user_id, month)
+        ) WITHOUT ROWID
+    """)
+    c.execute(f"""
+        CREATE TABLE IF NOT EXISTS expense_name_totals (
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            expense_count INTEGER NOT NULL,
+            {total} {total_type} NOT NULL,
+            PRIMARY KEY (user_id, name)
+        ) WITHOUT ROWID
+    """)
+    _create_summary_triggers(c, "expenses", cost, total)
+
+''' Creates the triggers keeping the summary tables current as rows of an expense table change. '''
+def _create_summary_triggers(c, table, cost, total):
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_summary_insert AFTER INSERT ON {table} BEGIN
+            {_SUMMARY_UPSERTS.format(row="new", sign=1, cost=cost, total=total)}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_summary_delete AFTER DELETE ON {table} BEGIN
+            {_SUMMARY_UPSERTS.format(row="old", sign=-1, cost=cost, total=total)}
+            {_SUMMARY_CLEANUP}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_summary_update
+        AFTER UPDATE OF user_id, name, {cost}, date ON {table} BEGIN
+            {_SUMMARY_UPSERTS.format(row="old", sign=-1, cost=cost, total=total)}
+            {_SUMMARY_UPSERTS.format(row="new", sign=1, cost=cost, total=total)}
+            {_SUMMARY_CLEANUP}
+        END
+    """)
+
+def _fill_summaries(c, cost, total, source="expenses"):
+    c.execute("DELETE FROM expense_monthly_totals")
+    c.execute(f"""
+        INSERT INTO expense_monthly_totals (user_id, month, expense_count, {total})
+        SELECT user_id, substr(date, 1, 7), COUNT(*), SUM({cost}) FROM {source} GROUP BY user_id, substr(date, 1, 7)
+    """)
+    c.execute("DELETE FROM expense_name_totals")
+    c.execute(f"""
+        INSERT INTO expense_name_totals (user_id, name, expense_count, {total})
+        SELECT user_id, name, COUNT(*), SUM({cost}) FROM {source} GROUP BY user_id, name
+    """)
+
+''' Recomputes the monthly and per-name expense totals from the 'expenses' table and its archives.
+    The triggers keep them current on every change; this restores consistency if they ever drift.
+
+    :param c: A cursor inside the transaction to rebuild in. '''
+def rebuild_summaries(c):
+    tables = ["expenses"] + [archive_table(year) for year in archived_years(c)]
+    source = " UNION ALL ".join(f"SELECT user_id, name, cost_cents, date FROM {table}" for table in tables)
+    _fill_summaries(c, "cost_cents", "total_cents", f"({source})")
+
+''' Adds per-user monthly and per-name expense totals, maintained incrementally by triggers,
+    so summaries cost a read of O(months) or O(names) rows instead of a scan of every expense. '''
+def _create_expense_summaries(c):
+    _create_summaries(c, "cost", "total_cost", "REAL")
+    _fill_summaries(c, "cost", "total_cost")
+
+''' Stores expense costs as integer cents so sums are exact.
+    SQLite can't change a column's type, so 'expenses' is rebuilt with a cost_cents column,
+    keeping every id and the AUTOINCREMENT sequence, and its indexes, triggers and the
+    summary tables are recreated for the new column. '''
+def _store_costs_as_cents(c):
+    c.execute("SELECT seq FROM sqlite_sequence WHERE name='expenses'")
+    sequence = c.fetchone()
+    c.execute("DROP TABLE expense_monthly_totals")
+    c.execute("DROP TABLE expense_name_totals")
+    c.execute("""
+        CREATE TABLE expenses_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            cost_cents INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            description TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    c.execute("""
+        INSERT INTO expenses_new (id, user_id, name, cost_cents, date, description)
+        SELECT id, user_id, name, CAST(ROUND(cost * 100) AS INTEGER), date, description FROM expenses
+    """)
+    # Dropping the old table also drops its indexes and triggers.
+    c.execute("DROP TABLE expenses")
+    c.execute("ALTER TABLE expenses_new RENAME TO expenses")
+    if sequence:
+        c.execute("UPDATE sqlite_sequence SET seq=MAX(seq, ?) WHERE name='expenses'", sequence)
+    c.execute("CREATE INDEX idx_expenses_user_id ON expenses(user_id)")
+    c.execute("CREATE INDEX idx_expenses_user_date ON expenses(user_id, date)")
+    c.execute("CREATE INDEX idx_expenses_user_name ON expenses(user_id, name)")
+    c.execute("CREATE INDEX idx_expenses_user_cost ON expenses(user_id, cost_cents)")
+    # Ids and text are unchanged, so the full-text index is still valid; only its triggers are recreated.
+    _create_fts_triggers(c)
+    _create_summaries(c, "cost_cents", "total_cents", "INTEGER")
+    _fill_summaries(c, "cost_cents", "total_cents")
+    c.execute("ANALYZE")
+
+''' Adds rules for expenses that repeat, such as rent or subscriptions.
+    next_due is the date of the first occurrence not yet added as an expense, or NULL once the rule
+    has ended, and the partial index on it lets the scheduler find the due rules without scanning the rest. '''
+def _create_recurring_expenses(c):
+    c.execute("""
+        CREATE TABLE recurring_expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            cost_cents INTEGER NOT NULL,
+            description TEXT,
+            frequency TEXT NOT NULL CHECK (frequency IN ('daily', 'weekly', 'monthly', 'yearly')),
+            interval INTEGER NOT NULL DEFAULT 1 CHECK (interval >= 1),
+            start_date TEXT NOT NULL,
+            until_date TEXT,
+            max_count INTEGER,
+            occurrences INTEGER NOT NULL DEFAULT 0,
+            next_due TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    c.execute("CREATE INDEX idx_recurring_next_due ON recurring_expenses(next_due) WHERE next_due IS NOT NULL")
+    c.execute("CREATE INDEX idx_recurring_user_id ON recurring_expenses(user_id)")
+
+''' Adds the catalog of archived years. Expenses older than a horizon can be moved out of
+    'expenses' into one table per year (see archive.py), so everyday reads only touch recent rows. '''
+def _create_expense_archives(c):
+    c.execute("CREATE TABLE expense_archives (year INTEGER PRIMARY KEY, archived_at TEXT NOT NULL)")
+
+''' Returns the name of the table holding the expenses archived from a year. '''
+def archive_table(year):
+    return f"expenses_archive_{int(year)}"
+
+''' Returns the years that have an archive table, oldest first. '''
+def archived_years(c):
+    return [row[0] for row in c.execute("SELECT year FROM expense_archives ORDER BY year").fetchall()]
+
+''' Creates the archive table for a year if it doesn't exist yet. It has the columns of 'expenses',
+    an index for reading a user's expenses by date, and the same summary triggers, so the
+    summary tables keep counting archived expenses and stay right when they are edited. '''
+def create_archive_table(c, year):
+    table = archive_table(year)
+    c.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            cost_cents INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            description TEXT
+        )
+    """)
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_date ON {table}(user_id, date)")
+    _create_summary_triggers(c, table, "cost_cents", "total_cents")
+    _create_change_triggers(c, table, "user_id")
+    c.execute(
+        "INSERT OR IGNORE INTO expense_archives (year, archived_at) VALUES (?, datetime('now'))", (int(year),)
+    )
+
+''' Creates the triggers recording each changed row of a table in 'change_log'.
+
+    :param user_column: The column holding the ID of the user a row belongs to. '''
+def _create_change_triggers(c, table, user_column):
+    # Nothing is recorded until a backup has been taken, so the log only grows while it's needed.
+    logging = "EXISTS (SELECT 1 FROM change_log_state)"
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_change_insert AFTER INSERT ON {table} WHEN {logging} BEGIN
+            INSERT INTO change_log (table_name, row_id, user_id) VALUES ('{table}', new.id, new.{user_column});
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_change_update AFTER UPDATE ON {table} WHEN {logging} BEGIN
+            INSERT INTO change_log (table_name, row_id, user_id) VALUES ('{table}', new.id, new.{user_column});
+            INSERT INTO change_log (table_name, row_id, user_id)
+            SELECT '{table}', old.id, old.{user_column} WHERE old.id != new.id OR old.{user_column} != new.{user_column};
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_change_delete AFTER DELETE ON {table} WHEN {logging} BEGIN
+            INSERT INTO change_log (table_name, row_id, user_id) VALUES ('{table}', old.id, old.{user_column});
+        END
+    """)
+
+''' Adds a log of the rows changed since the last backup, for incremental backups (see backup.py).
+    change_log_state has a row once a backup has been taken; pruned_seq is the last change
+    already covered by a backup and dropped from the log. '''
+def _create_change_log(c):
+    c.execute("""
+        CREATE TABLE change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            user_id INTEGER
+        )
+    """)
+    c.execute("""
+        CREATE TABLE change_log_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            pruned_seq INTEGER NOT NULL
+        )
+    """)
+    _create_change_triggers(c, "users", "id")
+    _create_change_triggers(c, "expenses", "user_id")
+    _create_change_triggers(c, "recurring_expenses", "user_id")
+    for year in archived_years(c):
+        _create_change_triggers(c, archive_table(year), "user_id")
+
+# Schema migrations in order. A database at schema version N has had the first N applied,
+# so new migrations must only ever be appended to this list.
+MIGRATIONS = [
+    _create_base_tables,
+    _create_expense_indexes,
+    _create_expense_search,
+    _create_expense_summaries,
+    _store_costs_as_cents,
+    _create_recurring_expenses,
+    _create_expense_archives,
+    _create_change_log,
+]
+
+''' Applies performance settings to a connection.
+    WAL lets readers keep reading while a write commits, and synchronous=NORMAL is durable
+    under WAL while skipping an fsync per commit. '''
+def configure_connection(conn, read_only=False):
+    if not read_only:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MiB page cache.
+    conn.execute("PRAGMA mmap_size=268435456")  # Map up to 256 MiB of the file.
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+''' Opens a tuned connection to the database file without migrating it.
+
+    :param path: Path of the database file.
+    :param read_only: Open the file read-only. Under WAL, read-only connections read concurrently with a writer.
+    :param check_same_thread: Passed to sqlite3.connect; False lets a connection be closed from another thread.
+    :param timeout: Seconds to wait on a lock held by another connection before raising "database is locked". '''
+def connect(path=DB_PATH, read_only=False, check_same_thread=True, timeout=BUSY_TIMEOUT):
+    if read_only:
+        conn = sqlite3.connect(
+            Path(path).absolute().as_uri() + "?mode=ro", uri=True, timeout=timeout,
+            check_same_thread=check_same_thread, factory=connection_factory()
+        )
+    else:
+        conn = sqlite3.connect(path, timeout=timeout, check_same_thread=check_same_thread, factory=connection_factory())
+    configure_connection(conn, read_only)
+    return conn
+
+''' Returns whether an exception means another connection held a lock for longer than the busy timeout. '''
+def is_busy_error(error):
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(error) or "busy" in str(error)
+
+''' Calls func(), calling it again with exponential backoff and jitter while it fails because
+    the database is locked. Use it around a whole transaction, which is safe to repeat once rolled back.
+
+    :param attempts: Number of calls before the busy error is raised.
+    :param delay: Seconds to wait before the second call; each later wait doubles. '''
+def retry_busy(func, attempts=5, delay=0.05):
+    for attempt in range(attempts):
+        try:
+            return func()
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == attempts - 1:
+                raise
+        time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+''' Brings the database schema up to date, applying each pending migration in its own transaction.
+    Each transaction takes the write lock before reading the schema version, so when several
+    processes start at once only one of them applies a given migration.
+
+    :param conn: The database connection object. '''
+def migrate(conn):
+    while conn.execute("PRAGMA user_version").fetchone()[0] < len(MIGRATIONS):
+        retry_busy(lambda: _apply_next_migration(conn))
+
+def _apply_next_migration(conn):
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        if version < len(MIGRATIONS):
+            MIGRATIONS[version](c)
+            c.execute(f"PRAGMA user_version={version + 1}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+''' Initialize the SQLite database.
+    Opens the database file, tunes the connection and upgrades the schema in place. '''
+def init_db(path=DB_PATH):
+
+    # Connect to the SQLite database file 'expense_tracker.db'.
+    # If the file doesn't exist, it will be created.
+    conn = connect(path)
+    migrate(conn)
     return conn
@@ -0,0 +1,201 @@
+import queue
+import sqlite3
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+from database import DB_PATH, BUSY_TIMEOUT, connect, init_db, is_busy_error, retry_busy
+from profiling import timed
+
+# Busy timeout for a database shared between processes, where another process may hold the write lock.
+SHARED_BUSY_TIMEOUT = 30.0
+# SQLite virtual machine instructions between checks of whether a running read is still wanted.
+CANCEL_CHECK_INSTRUCTIONS = 10000
+
+''' Raised in place of the result of a read that was cancelled. Its callbacks are never called. '''
+class ReadCancelled(Exception):
+    pass
+
+''' Runs all database work off the GUI thread.
+    Writes go through a single writer thread with its own connection, so they are serialized,
+    while reads are spread over a pool of read-only connections that, under WAL, run
+    concurrently with each other and with the writer.
+
+    The writer commits writes in groups: every write queued while the previous transaction was
+    running, up to max_batch of them, runs in the next transaction, each inside its own savepoint,
+    so a burst of writes takes the write lock and commits once instead of once per write. A write
+    that raises only rolls back its own savepoint. With shared=True, for a database file used by
+    several processes at once, the writer waits longer for another process to release the write
+    lock, and a transaction that still can't get it is retried with backoff.
+
+    Each job is a function taking a connection as its first argument. read() and write()
+    return a concurrent.futures.Future, and optionally call back on the GUI thread with the
+    result or the exception once the job finishes. Exceptions without an error callback are
+    reported through sys.excepthook. '''
+class DatabaseService(QObject):
+    _job_done = pyqtSignal(object, object)  # Callback, result or exception.
+
+    """ Initializes the DatabaseService instance, migrating the database before any worker opens it.
+
+        :param path: Path of the database file.
+        :param read_workers: Number of read-only connections in the read pool.
+        :param shared: Whether other processes write to the same database file.
+        :param max_batch: Most writes committed in one transaction. 1 commits every write on its own. """
+    def __init__(self, path=DB_PATH, read_workers=4, shared=False, max_batch=256, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.shared = shared
+        self.max_batch = max_batch
+        self.busy_timeout = SHARED_BUSY_TIMEOUT if shared else BUSY_TIMEOUT
+        init_db(path).close()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+        self._writer.start()
+        self._readers = ThreadPoolExecutor(
+            max_workers=read_workers, thread_name_prefix="db-reader", initializer=self._open_connection,
+            initargs=(True,)
+        )
+        # Emitted from worker threads, so Qt queues the callback onto the thread this object lives in.
+        self._job_done.connect(self._run_callback)
+
+    ''' Runs a read-only job on the read pool.
+
+        :param job: A function taking a connection followed by *args.
+        :param callback: Called on the GUI thread with the job's return value.
+        :param error_callback: Called on the GUI thread with the exception if the job raises.
+        :param cancelled: Optional function returning True once the result is no longer wanted, such
+            as after a newer query replaced this one. It is called from the reader thread before the
+            job starts and every few thousand SQLite instructions while it runs, and a cancelled job
+            is skipped or interrupted, freeing its connection for newer reads.
+        :return: A Future for the job's return value, which raises ReadCancelled if it was cancelled. '''
+    def read(self, job, *args, callback=None, error_callback=None, cancelled=None):
+        future = self._readers.submit(self._run_read, job, args, cancelled)
+        return self._watch(future, callback, error_callback)
+
+    ''' Queues a job for the writer thread, which runs it in a transaction with any other queued
+        writes. Its changes are committed if the job returns and rolled back if it raises.
+        Takes the same arguments as read(). '''
+    def write(self, job, *args, callback=None, error_callback=None):
+        future = Future()
+        self._write_queue.put((future, job, args))
+        return self._watch(future, callback, error_callback)
+
+    ''' Waits for pending jobs and closes every connection. '''
+    def shutdown(self):
+        self._write_queue.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    def _open_connection(self, read_only):
+        conn = connect(self.path, read_only=read_only, check_same_thread=False, timeout=self.busy_timeout)
+        self._local.conn = conn
+        with self._connections_lock:
+            self._connections.append(conn)
+
+    def _run_read(self, job, args, cancelled):
+        conn = self._local.conn
+        if cancelled is None:
+            return job(conn, *args)
+        if cancelled():
+            raise ReadCancelled()
+        # A true return value from the progress handler aborts the running statement.
+        conn.set_progress_handler(cancelled, CANCEL_CHECK_INSTRUCTIONS)
+        try:
+            return job(conn, *args)
+        except sqlite3.OperationalError:
+            if cancelled():
+                raise ReadCancelled()
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def _write_loop(self):
+        self._open_connection(False)
+        stopping = False
+        while not stopping:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._run_batch([entry for entry in batch if entry[0].set_running_or_notify_cancel()])
+
+    @timed("db.write_batch")
+    def _run_batch(self, batch):
+        if not batch:
+            return
+        try:
+            # Another process holding the write lock past the busy timeout fails the whole
+            # transaction before any of it is committed, so it is safe to run again.
+            outcomes = retry_busy(lambda: self._commit_batch(batch))
+        except Exception as e:
+            for future, _, _ in batch:
+                future.set_exception(e)
+            return
+        for (future, _, _), (succeeded, value) in zip(batch, outcomes):
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    ''' Runs a batch of write jobs in one transaction and returns a (succeeded, result or exception)
+        pair for each. IMMEDIATE takes the write lock up front, so the busy timeout applies to it
+        rather than to a read lock that can't be upgraded once another process has written. '''
+    def _commit_batch(self, batch):
+        conn = self._local.conn
+        outcomes = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for _, job, args in batch:
+                conn.execute("SAVEPOINT write_job")
+                try:
+                    result = job(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_job")
+                    conn.execute("RELEASE write_job")
+                    if is_busy_error(e):
+                        raise
+                    outcomes.append((False, e))
+                else:
+                    conn.execute("RELEASE write_job")
+                    outcomes.append((True, result))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return outcomes
+
+    def _watch(self, future, callback, error_callback):
+        future.add_done_callback(lambda f: self._finish(f, callback, error_callback))
+        return future
+
+    def _finish(self, future, callback, error_callback):
+        error = future.exception()
+        if isinstance(error, ReadCancelled):
+            return
+        if error is None:
+            if callback is not None:
+                self._job_done.emit(callback, future.result())
+        else:
+            self._job_done.emit(error_callback or self._report_error, error)
+
+    def _run_callback(self, callback, value):
+        callback(value)
+
+    def _report_error(self, error):
+        sys.excepthook(type(error), error, error.__traceback__)
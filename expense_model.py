@@ -0,0 +1,269 @@
+from bisect import bisect_left
+from functools import total_ordering
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+from expense_query import ExpenseFilter, SORT_COLUMNS
+from repository import ExpenseRepository, DATE_COLUMN
+from formatting import display_cents, display_date
+from profiling import timed
+
+''' Wraps a sort key so that it orders in reverse, keeping descending key lists bisectable. '''
+@total_ordering
+class _Descending:
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return self.key > other.key
+
+''' A read-only table model over a single user's expenses.
+    Rows are fetched from the database lazily, one page at a time, as the view scrolls,
+    and cells are only formatted when the view asks for them.
+    Filtering and sorting happen in SQL: pages are read through an ExpenseRepository with
+    keyset pagination on (sort column, id), which the per-user sort indexes answer directly.
+    Queries run on the DatabaseService read pool; results of a query superseded by a
+    later reload are dropped when they arrive.
+    Added, updated and deleted expenses are patched into the loaded rows and the cached
+    totals in place, so single-row changes never reload the table. '''
+class ExpenseTableModel(QAbstractTableModel):
+    totals_changed = pyqtSignal(int, object)  # Expense count, total cents.
+    HEADERS = ["ID", "Name", "Cost", "Date", "Description"]
+    PAGE_SIZE = 256
+
+    def __init__(self, service, user_id, parent=None):
+        super().__init__(parent)
+        self.service = service
+        self.user_id = user_id
+        self._rows = []  # Raw (id, name, cost_cents, date, description) tuples fetched so far.
+        self._keys = []  # Sort key of each loaded row, kept in step with self._rows.
+        self._has_more = True
+        self._fetching = False
+        # Bumped on every reload; reads of older generations are cancelled, and late results ignored.
+        self._generation = 0
+        self.expense_filter = ExpenseFilter()
+        self.sort_column = DATE_COLUMN
+        self.sort_order = Qt.AscendingOrder
+        self.expense_count = 0
+        self.total_cents = 0
+        self._repository = self._create_repository()
+
+    ''' Discards all fetched rows, then loads the totals and the first page again. '''
+    @timed("model.reload")
+    def reload(self):
+        self._generation += 1
+        generation = self._generation
+        self._repository = self._create_repository()
+        self.beginResetModel()
+        self._rows = []
+        self._keys = []
+        self._has_more = True
+        self._fetching = False
+        self.endResetModel()
+        self.service.read(
+            self._repository.totals, callback=lambda totals: self._totals_loaded(generation, totals),
+            cancelled=self._superseded(generation)
+        )
+        self.fetchMore(QModelIndex())
+
+    ''' Shows another user's expenses, clearing the filter. With no user the table is emptied without
+        querying, so a logged-out model holds no rows.
+
+        :param user_id: The ID of the user whose expenses to show, or None. '''
+    def set_user(self, user_id):
+        self.user_id = user_id
+        self.expense_filter = ExpenseFilter()
+        if user_id is not None:
+            self.reload()
+            return
+        self._generation += 1
+        self.beginResetModel()
+        self._rows = []
+        self._keys = []
+        self._has_more = False
+        self._fetching = False
+        self.endResetModel()
+        self.expense_count = 0
+        self.total_cents = 0
+        self.totals_changed.emit(0, 0)
+
+    ''' Shows only the expenses matching a filter, reloading the table if the filter changed.
+
+        :param expense_filter: An ExpenseFilter with the search criteria.
+        :return: Whether the filter changed. '''
+    def set_filter(self, expense_filter):
+        if expense_filter == self.expense_filter:
+            return False
+        self.expense_filter = expense_filter
+        self.reload()
+        return True
+
+    ''' Sorts the expenses in the database by a column and reloads the table. Unsortable columns are ignored. '''
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column not in SORT_COLUMNS or (column, order) == (self.sort_column, self.sort_order):
+            return
+        self.sort_column = column
+        self.sort_order = order
+        self.reload()
+
+    ''' Returns whether a page of expenses is being read. '''
+    def is_fetching(self):
+        return self._fetching
+
+    ''' Returns the raw database row displayed at the given row number. '''
+    def row_at(self, row):
+        return self._rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return section + 1
+
+    @timed("model.data")
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        data = self._rows[index.row()][index.column()]
+        # Cost column: format cents as dollars.
+        if index.column() == 2:
+            return display_cents(data)
+        # Date column: reformat from yyyy-MM-dd to "Month day, Year".
+        if index.column() == 3:
+            return display_date(data)
+        return str(data)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._has_more
+
+    ''' Requests the next page of expenses, continuing after the sort key of the last loaded row. '''
+    def fetchMore(self, parent):
+        if parent.isValid() or not self._has_more or self._fetching:
+            return
+        self._fetching = True
+        generation = self._generation
+        repository = self._repository
+        if self._rows:
+            self.service.read(
+                repository.page_after, repository.cursor(self._rows[-1]),
+                callback=lambda page: self._page_loaded(generation, page), cancelled=self._superseded(generation)
+            )
+        else:
+            self.service.read(
+                repository.first_page,
+                callback=lambda page: self._page_loaded(generation, page), cancelled=self._superseded(generation)
+            )
+
+    ''' Returns a function telling, from any thread, whether a reload has replaced a generation's reads. '''
+    def _superseded(self, generation):
+        return lambda: generation != self._generation
+
+    def _create_repository(self):
+        return ExpenseRepository(
+            self.user_id, self.expense_filter, self.sort_column, self.sort_order == Qt.DescendingOrder, self.PAGE_SIZE
+        )
+
+    def _totals_loaded(self, generation, totals):
+        if generation != self._generation:
+            return
+        self.expense_count, self.total_cents = totals
+        self.totals_changed.emit(self.expense_count, self.total_cents)
+
+    @timed("model._page_loaded")
+    def _page_loaded(self, generation, page):
+        if generation != self._generation:
+            return
+        self._fetching = False
+        self._has_more = page.has_next
+        rows = page.rows
+        if not rows:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self._keys.extend(self._sort_key(row) for row in rows)
+        self.endInsertRows()
+
+    ''' Adds a newly inserted expense to the loaded rows and the totals, if it matches the filter.
+
+        :param row: The new (id, name, cost_cents, date, description) row.
+        :param matches: Whether the row matches the current filter, as checked by ExpenseFilter.matches. '''
+    @timed("model.insert_expense")
+    def insert_expense(self, row, matches):
+        if not matches:
+            return
+        self._insert_row(row)
+        self._patch_totals(1, row[2])
+
+    ''' Replaces a loaded expense with its updated values, moving it if its sort position changed
+        and dropping it if it no longer matches the filter.
+
+        :param old_row: The row as it was loaded before the update.
+        :param new_row: The row as it is stored after the update.
+        :param matches: Whether the updated row matches the current filter. '''
+    @timed("model.update_expense")
+    def update_expense(self, old_row, new_row, matches):
+        position = self._find_row(old_row)
+        if matches and position is not None and self._sort_key(old_row) == self._sort_key(new_row):
+            self._rows[position] = new_row
+            self.dataChanged.emit(self.index(position, 0), self.index(position, self.columnCount() - 1))
+        else:
+            self._remove_row(old_row)
+            if matches:
+                self._insert_row(new_row)
+        self._patch_totals(int(matches) - 1, (new_row[2] if matches else 0) - old_row[2])
+
+    ''' Removes a deleted expense from the loaded rows and the totals.
+
+        :param row: The row as it was loaded before the deletion. '''
+    @timed("model.remove_expense")
+    def remove_expense(self, row):
+        self._remove_row(row)
+        self._patch_totals(-1, -row[2])
+
+    def _sort_key(self, row):
+        key = self._repository.cursor(row)
+        return key if self.sort_order == Qt.AscendingOrder else _Descending(key)
+
+    ''' Returns the position of a loaded row, or None if it has not been fetched. '''
+    def _find_row(self, row):
+        key = self._sort_key(row)
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return position
+        return None
+
+    def _insert_row(self, row):
+        key = self._sort_key(row)
+        position = bisect_left(self._keys, key)
+        # Rows past the last loaded one will arrive with a later page.
+        if position == len(self._keys) and self._has_more:
+            return
+        self.beginInsertRows(QModelIndex(), position, position)
+        self._rows.insert(position, row)
+        self._keys.insert(position, key)
+        self.endInsertRows()
+
+    def _remove_row(self, row):
+        position = self._find_row(row)
+        if position is None:
+            return
+        self.beginRemoveRows(QModelIndex(), position, position)
+        del self._rows[position]
+        del self._keys[position]
+        self.endRemoveRows()
+
+    def _patch_totals(self, count_delta, cents_delta):
+        self.expense_count += count_delta
+        self.total_cents += cents_delta
+        self.totals_changed.emit(self.expense_count, self.total_cents)
@@ -0,0 +1,72 @@
+import re
+
+# Columns the expense table can be sorted by, by table column number.
+# Each is covered by an index starting with user_id, so sorted pages are index scans.
+SORT_COLUMNS = {0: "id", 1: "name", 2: "cost_cents", 3: "date"}
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+''' Turns free text into an FTS5 query matching rows that contain every word as a prefix. '''
+def fts_query(text):
+    return " ".join(f'"{token}"*' for token in _TOKEN.findall(text))
+
+''' Turns free text into LIKE patterns, one per word, for tables without a full-text index. '''
+def like_patterns(text):
+    return ["%" + token.replace("_", "\\_") + "%" for token in _TOKEN.findall(text)]
+
+''' The search criteria for a user's expenses. Empty criteria match everything. '''
+class ExpenseFilter:
+
+    """ Initializes the ExpenseFilter instance.
+
+        :param text: Words to find in the expense name or description.
+        :param date_from: Earliest date to include, as yyyy-MM-dd.
+        :param date_to: Latest date to include, as yyyy-MM-dd.
+        :param min_cents: Lowest cost to include, in cents.
+        :param max_cents: Highest cost to include, in cents. """
+    def __init__(self, text="", date_from=None, date_to=None, min_cents=None, max_cents=None):
+        self.text = text
+        self.date_from = date_from
+        self.date_to = date_to
+        self.min_cents = min_cents
+        self.max_cents = max_cents
+
+    def is_empty(self):
+        return not fts_query(self.text) and all(
+            value is None for value in (self.date_from, self.date_to, self.min_cents, self.max_cents)
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, ExpenseFilter) and vars(self) == vars(other)
+
+    ''' Returns a parameterized WHERE clause selecting a user's expenses that match the filter.
+
+        :param user_id: The ID of the user whose expenses are searched.
+        :param full_text: Whether to search the text through the 'expenses_fts' index. Archive
+            tables aren't indexed, so for them each word is matched anywhere in the name or description.
+        :return: Tuple of (sql, params), where sql starts with "WHERE". '''
+    def where_clause(self, user_id, full_text=True):
+        conditions = ["user_id=?"]
+        params = [user_id]
+        if self.date_from is not None:
+            conditions.append("date>=?")
+            params.append(self.date_from)
+        if self.date_to is not None:
+            conditions.append("date<=?")
+            params.append(self.date_to)
+        if self.min_cents is not None:
+            conditions.append("cost_cents>=?")
+            params.append(self.min_cents)
+        if self.max_cents is not None:
+            conditions.append("cost_cents<=?")
+            params.append(self.max_cents)
+        if full_text:
+            match = fts_query(self.text)
+            if match:
+                conditions.append("id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)")
+                params.append(match)
+        else:
+            for pattern in like_patterns(self.text):
+                conditions.append("(name LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\')")
+                params += [pattern, pattern]
+        return "WHERE " + " AND ".join(conditions), params
@@ -0,0 +1,99 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+from database import connect
+from formatting import parse_iso_date
+from repository import ExpenseRepository
+from profiling import timed
+
+# Number of rows pulled from the database per page while exporting.
+BATCH_SIZE = 5000
+COST_FORMAT = '"$"#,##0.00'
+DATE_FORMAT = "mmmm d, yyyy"
+
+''' Exports a user's expenses to an Excel file on a worker thread.
+    Rows are read a page at a time, ordered by date, into a write-only workbook,
+    so memory use stays flat no matter how many expenses are exported.
+    Move the worker to a QThread and connect the thread's started signal to run(). '''
+class ExportWorker(QObject):
+    progress = pyqtSignal(int, int)  # Rows written so far, total rows.
+    finished = pyqtSignal(int)  # Rows written.
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    """ Initializes the ExportWorker instance.
+
+        :param db_path: Path of the database file. The worker opens its own connection on its thread.
+        :param user_id: The ID of the user whose expenses are exported.
+        :param file_path: Path of the .xlsx file to write. """
+    def __init__(self, db_path, user_id, file_path):
+        super().__init__()
+        self.db_path = db_path
+        self.user_id = user_id
+        self.file_path = file_path
+        self._cancel_requested = False
+        self._cell_type = None  # openpyxl's WriteOnlyCell, imported when the export runs.
+
+    ''' Asks the export to stop after the current batch. Safe to call from any thread. '''
+    def cancel(self):
+        self._cancel_requested = True
+
+    def run(self):
+        try:
+            written = self._export()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        if written is None:
+            self.cancelled.emit()
+        else:
+            self.finished.emit(written)
+
+    ''' Writes the workbook and returns the number of rows written, or None if cancelled. '''
+    def _export(self):
+        # openpyxl takes a while to import, so it is only loaded once an export actually runs.
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        self._cell_type = WriteOnlyCell
+        conn = connect(self.db_path, read_only=True)
+        try:
+            # One read transaction keeps every page, and the count, on the same snapshot.
+            conn.execute("BEGIN")
+            repository = ExpenseRepository(self.user_id, page_size=BATCH_SIZE, include_archived=True)
+            total = repository.approximate_count(conn)
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("Expenses")
+            # Write header row.
+            ws.append(["ID", "Name", "Cost", "Date", "Description"])
+            written = 0
+            page = repository.first_page(conn)
+            while page.rows:
+                if self._cancel_requested:
+                    return None
+                rows = page.rows
+                with timed("export.write_batch"):
+                    for expense_id, name, cost_cents, exp_date, desc in rows:
+                        ws.append([expense_id, name, self._cost_cell(ws, cost_cents), self._date_cell(ws, exp_date), desc])
+                written += len(rows)
+                self.progress.emit(written, total)
+                if not page.has_next:
+                    break
+                page = repository.page_after(conn, page.last_cursor)
+            with timed("export.save"):
+                wb.save(self.file_path)
+            return written
+        finally:
+            conn.close()
+
+    def _cost_cell(self, ws, cost_cents):
+        # Excel stores numbers as doubles; the exact cents are only rounded at this boundary.
+        cell = self._cell_type(ws, value=cost_cents / 100)
+        cell.number_format = COST_FORMAT
+        return cell
+
+    def _date_cell(self, ws, exp_date):
+        value = parse_iso_date(exp_date)
+        if value is None:
+            # Leave dates that aren't yyyy-mm-dd as they were stored.
+            return exp_date
+        cell = self._cell_type(ws, value=value)
+        cell.number_format = DATE_FORMAT
+        return cell
@@ -0,0 +1,46 @@
+from datetime import date
+from functools import lru_cache
+from PyQt5.QtCore import QDate
+from money import format_cents
+
+# Display formatters shared by the table, the form, the summary and the export.
+# Dates are always stored as ISO yyyy-mm-dd text, which stays the source of truth: these only
+# ever go from the stored value to a display value, never back. A ledger repeats a few thousand
+# distinct dates and amounts, so each result is cached in a bounded LRU cache.
+CACHE_SIZE = 8192
+
+''' Parses a stored yyyy-mm-dd date into a datetime.date, or returns None if it isn't one. '''
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_iso_date(iso_date):
+    try:
+        return date.fromisoformat(iso_date)
+    except (TypeError, ValueError):
+        return None
+
+''' Returns a stored yyyy-mm-dd date as a QDate, or an invalid QDate if it isn't one. '''
+def iso_to_qdate(iso_date):
+    value = parse_iso_date(iso_date)
+    return QDate(value.year, value.month, value.day) if value is not None else QDate()
+
+''' Formats a stored yyyy-mm-dd date for display, e.g. "2024-03-05" -> "March 5, 2024".
+    Values that aren't ISO dates are shown as they were stored. '''
+@lru_cache(maxsize=CACHE_SIZE)
+def display_date(iso_date):
+    qdate = iso_to_qdate(iso_date)
+    return qdate.toString("MMMM d, yyyy") if qdate.isValid() else str(iso_date)
+
+''' Formats a stored yyyy-mm month for display, e.g. "2024-03" -> "March 2024". '''
+@lru_cache(maxsize=256)
+def display_month(iso_month):
+    qdate = QDate.fromString(iso_month, "yyyy-MM")
+    return qdate.toString("MMMM yyyy") if qdate.isValid() else str(iso_month)
+
+''' Formats integer cents as a dollar amount for display, e.g. 123450 -> "$1,234.50". '''
+@lru_cache(maxsize=CACHE_SIZE)
+def display_cents(cents):
+    return format_cents(cents)
+
+''' Empties every formatter cache, e.g. after the system locale changes. '''
+def clear_caches():
+    for formatter in (parse_iso_date, display_date, display_month, display_cents):
+        formatter.cache_clear()
@@ -0,0 +1,325 @@
+import csv
+import html
+import os
+import re
+import time
+from datetime import date, datetime
+from PyQt5.QtCore import QObject, pyqtSignal
+from archive import archive_tables_between
+from database import connect, retry_busy
+from money import parse_cents
+from profiling import timed
+
+# Number of parsed rows inserted per executemany call and transaction.
+CHUNK_SIZE = 5000
+
+# Accepted header names for each expense field, compared case-insensitively.
+COLUMN_ALIASES = {
+    "name": ("name", "payee", "merchant", "title", "expense name"),
+    "cost": ("cost", "amount", "debit", "price", "expense cost"),
+    "date": ("date", "transaction date", "posted date", "posting date", "expense date"),
+    "description": ("description", "memo", "notes", "details", "category"),
+}
+# Optional columns telling money coming in apart from money spent: a transaction type, or a
+# separate amount column for credits next to a debit column.
+TYPE_ALIASES = ("type", "transaction type", "debit/credit", "credit/debit", "dr/cr")
+CREDIT_ALIASES = ("credit", "credits", "credit amount", "deposit", "deposits")
+# Transaction types, compared case-insensitively, that mark a row as money coming in.
+CREDIT_TYPES = {"credit", "cr", "c", "deposit", "refund", "return", "payment", "income"}
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%Y/%m/%d", "%m/%d/%y", "%d.%m.%Y", "%B %d, %Y", "%b %d, %Y")
+
+''' Raised for a row that can't be turned into an expense. '''
+class InvalidRowError(ValueError):
+    pass
+
+def _find_column(normalized, aliases, exclude=None):
+    for alias in aliases:
+        if alias in normalized and normalized.index(alias) != exclude:
+            return normalized.index(alias)
+    return None
+
+''' Maps a header row to the index of each expense field. Name, cost and date are required.
+    Many bank and card exports have no name column and call the payee "Description", so
+    without a name column the description column is used as the name, and the description
+    is taken from another column if there is one. '''
+def _map_columns(header):
+    normalized = [str(h).strip().lower() if h is not None else "" for h in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        index = _find_column(normalized, aliases)
+        if index is not None:
+            columns[field] = index
+    if "name" not in columns and "description" in columns:
+        columns["name"] = columns.pop("description")
+        index = _find_column(normalized, COLUMN_ALIASES["description"], exclude=columns["name"])
+        if index is not None:
+            columns["description"] = index
+    missing = [field for field in ("name", "cost", "date") if field not in columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return columns
+
+def _cell(row, index):
+    return row[index] if index < len(row) else None
+
+def _is_blank(row):
+    return not row or all(value in (None, "") for value in row)
+
+def _is_empty_amount(value):
+    try:
+        return value in (None, "") or _signed_cents(value) == 0
+    except InvalidRowError:
+        return False
+
+''' Yields raw expense dicts from a table with a header row.
+    Rows are marked as credits only when the file says so, with a transaction type column or with
+    a credit amount in place of a debit one. Banks and card issuers disagree on which sign means
+    spending, so amounts are otherwise imported as spending whatever their sign, and negative
+    ones are marked so the import can report them for checking. '''
+def _rows_from_table(rows):
+    rows = iter(rows)
+    header = next(rows, [])
+    columns = _map_columns(header)
+    normalized = [str(h).strip().lower() if h is not None else "" for h in header]
+    type_index = _find_column(normalized, TYPE_ALIASES)
+    credit_index = _find_column(normalized, CREDIT_ALIASES, exclude=columns["cost"])
+    for row in rows:
+        if _is_blank(row):
+            continue
+        raw = {field: _cell(row, index) for field, index in columns.items()}
+        if type_index is not None:
+            raw["credit"] = str(_cell(row, type_index) or "").strip().lower() in CREDIT_TYPES
+        elif credit_index is not None:
+            raw["credit"] = _is_empty_amount(raw["cost"]) and not _is_empty_amount(_cell(row, credit_index))
+        else:
+            try:
+                raw["negative"] = _signed_cents(raw["cost"]) < 0
+            except InvalidRowError:
+                pass  # Reported as an invalid row when the row is normalized.
+        yield raw
+
+''' Yields raw expense dicts from a CSV file with a header row. '''
+def iter_csv_rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from _rows_from_table(csv.reader(f))
+
+''' Yields raw expense dicts from the first sheet of an Excel workbook with a header row.
+    The workbook is opened read-only so rows are streamed rather than loaded at once. '''
+def iter_xlsx_rows(path):
+    from openpyxl import load_workbook  # Imported on first use, as it is slow to load.
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from _rows_from_table(wb.worksheets[0].iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+''' Yields raw expense dicts for the transactions in an OFX/QFX statement, with credits marked.
+    Handles both SGML (OFX 1.x, unclosed tags) and XML (OFX 2.x) files, reading in chunks. '''
+def iter_ofx_rows(path):
+    transaction = None
+    buffer = ""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        while True:
+            chunk = f.read(65536)
+            buffer += chunk
+            # Only parse up to the last '<' so a tag split across chunks is kept for the next read.
+            cut = buffer.rfind("<") if chunk else len(buffer)
+            for closing, tag, value in _OFX_TAG.findall(buffer[:cut]):
+                tag = tag.upper()
+                if tag == "STMTTRN":
+                    if closing and transaction is not None:
+                        amount = transaction.get("TRNAMT", "")
+                        yield {
+                            "name": transaction.get("NAME") or transaction.get("PAYEE") or "Unknown",
+                            "cost": amount.lstrip("-"),
+                            "date": transaction.get("DTPOSTED", "")[:8],
+                            "description": transaction.get("MEMO"),
+                            "credit": not amount.startswith("-"),
+                        }
+                        transaction = None
+                    elif not closing:
+                        transaction = {}
+                elif transaction is not None and not closing:
+                    # SGML and XML statements both escape '&' and '<' in values as entities.
+                    transaction[tag] = html.unescape(value.strip())
+            buffer = buffer[cut:]
+            if not chunk:
+                break
+
+''' Returns the raw row iterator for a file based on its extension. '''
+def iter_file_rows(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return iter_csv_rows(path)
+    if extension in (".xlsx", ".xlsm"):
+        return iter_xlsx_rows(path)
+    if extension in (".ofx", ".qfx"):
+        return iter_ofx_rows(path)
+    raise ValueError(f"Unsupported file type: {extension}")
+
+def _signed_cents(value):
+    sign = 1
+    if isinstance(value, str):
+        value = value.strip()
+        # Accounting exports write negative amounts in parentheses.
+        if value.startswith("(") and value.endswith(")"):
+            value, sign = value[1:-1], -1
+    try:
+        return sign * parse_cents("" if value is None else value)
+    except ValueError:
+        raise InvalidRowError(f"Invalid cost: {value!r}")
+
+def _parse_cost(value):
+    # Exports disagree on the sign of spending; the ledger stores the amount spent.
+    return abs(_signed_cents(value))
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value or "").strip()
+    if re.fullmatch(r"\d{8}", text):
+        text = f"{text[:4]}-{text[4:6]}-{text[6:]}"
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise InvalidRowError(f"Invalid date: {value!r}")
+
+''' Validates a raw expense dict and returns it as a (name, cost_cents, date, description) tuple. '''
+def normalize_row(raw):
+    name = str(raw.get("name") or "").strip()
+    if not name:
+        raise InvalidRowError("Missing name")
+    description = raw.get("description")
+    description = str(description).strip() if description is not None else ""
+    return name, _parse_cost(raw.get("cost")), _parse_date(raw.get("date")), description
+
+''' Inserts normalized expenses for a user in chunks, skipping rows already in the ledger and
+    credits (money coming in, marked by the readers where the file says which rows they are).
+    Each chunk is staged with executemany into a temporary table and copied into 'expenses'
+    with one INSERT ... SELECT in a single transaction. Duplicates are matched against the
+    rows that existed before the import started, which the (user_id, date) index answers
+    with a range probe per row; repeated rows within the file itself are kept. Archive tables
+    are checked too for the archived years a chunk's dates fall in.
+
+    :param conn: The database connection object.
+    :param user_id: The ID of the user the expenses belong to.
+    :param rows: Iterable of raw expense dicts.
+    :param progress: Optional callable receiving the number of rows processed so far.
+    :param should_stop: Optional callable returning True to stop after the current chunk.
+    :return: Tuple of (inserted, duplicates, invalid, credits, negative) row counts, where negative
+        counts the valid rows with a negative amount, imported as spending but possibly refunds. '''
+def import_rows(conn, user_id, rows, progress=None, should_stop=None):
+    c = conn.cursor()
+    c.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS import_staging (
+            name TEXT NOT NULL, cost_cents INTEGER NOT NULL, date TEXT NOT NULL, description TEXT
+        )
+    """)
+    # Ids are never reused, so the sequence also covers archived expenses with higher ids than
+    # any left in 'expenses', such as old-dated rows imported last.
+    row = c.execute("SELECT seq FROM sqlite_sequence WHERE name='expenses'").fetchone()
+    last_existing_id = row[0] if row else 0
+    inserted = duplicates = invalid = credits = negative = processed = 0
+    chunk = []
+
+    @timed("import.insert_chunk")
+    def flush():
+        nonlocal inserted, duplicates
+        # Take the write lock before reading, so another process writing to a shared database
+        # makes this wait rather than fail when the read would have to be upgraded.
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("DELETE FROM import_staging")
+            c.executemany("INSERT INTO import_staging (name, cost_cents, date, description) VALUES (?, ?, ?, ?)", chunk)
+            c.execute("SELECT MIN(date), MAX(date) FROM import_staging")
+            tables = ["expenses"] + archive_tables_between(c, *c.fetchone())
+            not_exists = " AND ".join(f"""
+                NOT EXISTS (
+                    SELECT 1 FROM {table} e
+                    WHERE e.user_id=? AND e.date=s.date AND e.id<=?
+                      AND e.name=s.name AND e.cost_cents=s.cost_cents AND COALESCE(e.description, '')=s.description
+                )""" for table in tables)
+            c.execute(f"""
+                INSERT INTO expenses (user_id, name, cost_cents, date, description)
+                SELECT ?, s.name, s.cost_cents, s.date, s.description FROM import_staging s
+                WHERE {not_exists}
+            """, [user_id] + [user_id, last_existing_id] * len(tables))
+            inserted += c.rowcount
+            duplicates += len(chunk) - c.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        chunk.clear()
+
+    for raw in rows:
+        processed += 1
+        if raw.get("credit"):
+            credits += 1
+            continue
+        try:
+            chunk.append(normalize_row(raw))
+        except InvalidRowError:
+            invalid += 1
+        else:
+            if raw.get("negative"):
+                negative += 1
+        if len(chunk) >= CHUNK_SIZE:
+            retry_busy(flush)
+            if progress:
+                progress(processed)
+            if should_stop and should_stop():
+                break
+    else:
+        if chunk:
+            retry_busy(flush)
+        if progress:
+            progress(processed)
+    c.execute("PRAGMA optimize")
+    return inserted, duplicates, invalid, credits, negative
+
+''' Imports expenses from a CSV, XLSX or OFX file on a worker thread.
+    Move the worker to a QThread and connect the thread's started signal to run(). '''
+class ImportWorker(QObject):
+    progress = pyqtSignal(int)  # Rows processed so far.
+    finished = pyqtSignal(int, int, int, int, int, float)  # Inserted, duplicates, invalid, credits, negative, seconds.
+    failed = pyqtSignal(str)
+
+    """ Initializes the ImportWorker instance.
+
+        :param db_path: Path of the database file. The worker opens its own connection on its thread.
+        :param user_id: The ID of the user the expenses are imported for.
+        :param file_path: Path of the file to import. """
+    def __init__(self, db_path, user_id, file_path):
+        super().__init__()
+        self.db_path = db_path
+        self.user_id = user_id
+        self.file_path = file_path
+        self._cancel_requested = False
+
+    ''' Asks the import to stop after the current chunk. Chunks already inserted are kept. '''
+    def cancel(self):
+        self._cancel_requested = True
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            conn = connect(self.db_path)
+            try:
+                counts = import_rows(
+                    conn, self.user_id, iter_file_rows(self.file_path),
+                    progress=self.progress.emit, should_stop=lambda: self._cancel_requested
+                )
+            finally:
+                conn.close()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.finished.emit(*counts, time.perf_counter() - started)
@@ -0,0 +1,64 @@
+import numpy as np
+from archive import archive_tables_between
+
+''' A user's expenses as NumPy columns, sorted by date: `days` holds each expense's date as
+    datetime64[D] and `cents` its cost as int64. All aggregates are integer arithmetic over
+    the arrays, so they are exact and vectorized however many expenses there are. '''
+class Ledger:
+    def __init__(self, days, cents):
+        self.days = days
+        self.cents = cents
+
+    def __len__(self):
+        return len(self.cents)
+
+    ''' Returns the sum of every expense in cents. '''
+    def total(self):
+        return int(self.cents.sum())
+
+    ''' Groups expenses by calendar period and returns (periods, totals in cents, counts).
+
+        :param unit: A NumPy datetime unit: "D" for days, "W" for weeks, "M" for months or "Y" for years. '''
+    def totals_by(self, unit="M"):
+        if not len(self):
+            return np.array([], dtype=f"datetime64[{unit}]"), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        periods = self.days.astype(f"datetime64[{unit}]")
+        # Rows are sorted by date, so each period is one contiguous run.
+        starts = np.flatnonzero(np.concatenate(([True], periods[1:] != periods[:-1])))
+        counts = np.diff(np.append(starts, len(periods)))
+        return periods[starts], np.add.reduceat(self.cents, starts), counts
+
+    ''' Returns the cumulative spending in cents after each expense, in date order. '''
+    def running_balance(self):
+        return np.cumsum(self.cents)
+
+''' Loads a user's (date, cents) columns into a Ledger with one query and one batched fetch.
+    SQLite converts each date to days since the Unix epoch, so the rows arrive as integer
+    pairs that NumPy turns into arrays without per-row Python parsing. Rows whose date isn't
+    a valid yyyy-MM-dd date are left out.
+
+    :param conn: The database connection object.
+    :param user_id: The ID of the user whose expenses are loaded.
+    :param date_from: Optional earliest date, as yyyy-MM-dd.
+    :param date_to: Optional latest date, as yyyy-MM-dd. '''
+def load_ledger(conn, user_id, date_from=None, date_to=None):
+    conditions = ["user_id=?", "julianday(date) IS NOT NULL"]
+    params = [user_id]
+    if date_from is not None:
+        conditions.append("date>=?")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("date<=?")
+        params.append(date_to)
+    c = conn.cursor()
+    # Archived years are read as well when the date range reaches them.
+    tables = ["expenses"] + archive_tables_between(c, date_from, date_to)
+    union = " UNION ALL ".join(
+        f"SELECT id, date, cost_cents FROM {table} WHERE {' AND '.join(conditions)}" for table in tables
+    )
+    c.execute(
+        f"SELECT CAST(julianday(date) - 2440587.5 AS INTEGER), cost_cents FROM ({union}) ORDER BY date, id",
+        params * len(tables)
+    )
+    columns = np.array(c.fetchall(), dtype=np.int64).reshape(-1, 2)
+    return Ledger(columns[:, 0].astype("datetime64[D]"), np.ascontiguousarray(columns[:, 1]))
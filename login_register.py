@@ -1,23 +1,39 @@
-import hashlib
+import math
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QTabWidget, QLineEdit, QLabel, QPushButton,
-    QFormLayout, QHBoxLayout, QMessageBox
+    QFormLayout, QHBoxLayout, QMessageBox, QProgressBar
 )
 from PyQt5.QtCore import QSize, QDate
-
-''' Hashes the input password using SHA-256 and returns the hexadecimal digest. '''
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode('utf-8')).hexdigest()
-
-''' A widget that provides a login and registration interface for users. '''
+from passwords import CredentialCache, LoginThrottle, PasswordService, check_password, hash_password, needs_rehash
+from profiling import timed
+
+''' Looks up a user's (id, stored password hash) by the indexed username, or None. Runs on a database reader thread. '''
+def _find_credentials(conn, username):
+    c = conn.cursor()
+    c.execute("SELECT id, password FROM users WHERE username=?", (username,))
+    return c.fetchone()
+
+''' Replaces a user's password hash, unless it changed since it was read. Runs on the database writer thread. '''
+def _update_password(conn, user_id, old_hash, new_hash):
+    c = conn.cursor()
+    c.execute("UPDATE users SET password=? WHERE id=? AND password=?", (new_hash, user_id, old_hash))
+
+''' Creates a user. Runs on the database writer thread. '''
+def _create_user(conn, username, hashed_password):
+    c = conn.cursor()
+    c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
+
+''' A widget that provides a login and registration interface for users.
+    Passwords are hashed and checked on a PasswordService thread pool while a busy indicator is
+    shown, so the slow KDF never blocks the window, and repeated failures for a username are throttled. '''
 class LoginRegisterWidget(QWidget):
 
 
-    """ Initializes the LoginRegisterWidget instance with a database connection and a callback for successful logins.
+    """ Initializes the LoginRegisterWidget instance with the database service and a callback for successful logins.
 
-        :param conn: The database connection object.
+        :param service: The DatabaseService used for all database work.
         :param login_success_callback: A function to call when a user logs in successfully. """
-    def __init__(self, conn, login_success_callback):
+    def __init__(self, service, login_success_callback):
         super().__init__()
         self.tabs = None
         self.login_tab = None
@@ -28,8 +44,12 @@ class LoginRegisterWidget(QWidget):
         self.register_username_input = None
         self.register_password_input = None
         self.register_button = None
-        self.conn = conn
+        self.busy_indicator = None
+        self.service = service
         self.login_success_callback = login_success_callback
+        self.passwords = PasswordService(parent=self)
+        self.throttle = LoginThrottle()
+        self.credentials = CredentialCache()
         self.init_ui()
 
     def sizeHint(self):
@@ -46,9 +66,20 @@ class LoginRegisterWidget(QWidget):
         self.tabs.addTab(self.register_tab, "Register")
         self.setup_login_tab()
         self.setup_register_tab()
+        self.busy_indicator = QProgressBar()
+        self.busy_indicator.setRange(0, 0)  # No range shows a busy animation.
+        self.busy_indicator.setTextVisible(False)
+        self.busy_indicator.hide()
         layout.addWidget(self.tabs)
+        layout.addWidget(self.busy_indicator)
         self.setLayout(layout)
 
+    ''' Shows the busy indicator and disables the buttons while a password is being hashed or checked. '''
+    def set_busy(self, busy):
+        self.busy_indicator.setVisible(busy)
+        self.login_button.setEnabled(not busy)
+        self.register_button.setEnabled(not busy)
+
     ''' Configures the login tab with a form layout, including input fields for username and password. '''
     def setup_login_tab(self):
         layout = QFormLayout()
@@ -106,41 +137,102 @@ class LoginRegisterWidget(QWidget):
 
     ''' Handles the login button click event, validating user input and calling the login success callback if successful. '''
 
+    @timed("login.handle_login")
     def handle_login(self):
         """
-        Verifies user credentials. The provided password is hashed with SHA-256
-        and compared against the stored hash.
+        Verifies user credentials. The user's stored hash is looked up by username,
+        then the provided password is checked against it on the password thread pool.
         """
         username = self.login_username_input.text().strip()
         password = self.login_password_input.text().strip()
         if not username or not password:
             QMessageBox.warning(self, "Input Error", "Please enter both username and password!")
             return
-        hashed_password = hash_password(password)
-        c = self.conn.cursor()
-        c.execute("SELECT id FROM users WHERE username=? AND password=?", (username, hashed_password))
-        result = c.fetchone()
-        if result:
-            self.login_success_callback(result[0])
-        else:
+        wait = math.ceil(self.throttle.retry_after(username))
+        if wait:
+            QMessageBox.warning(
+                self, "Login Failed",
+                f"Too many failed attempts. Please try again in {wait} second{'s' if wait != 1 else ''}."
+            )
+            return
+        self.set_busy(True)
+        self.service.read(
+            _find_credentials, username,
+            callback=lambda credentials: self.credentials_found(username, password, credentials),
+            error_callback=self.login_error
+        )
+
+    def credentials_found(self, username, password, credentials):
+        user_id, stored = credentials or (None, None)
+        if credentials is not None and self.credentials.matches(username, stored, password):
+            self.login_checked(username, password, user_id, stored, True)
+            return
+        future = self.passwords.run(
+            check_password, password, stored,
+            callback=lambda valid: self.login_checked(username, password, user_id, stored, valid),
+            error_callback=self.login_error
+        )
+        if future is None:
+            self.set_busy(False)
+            QMessageBox.warning(self, "Login Failed", "Too many login attempts at once. Please wait a moment.")
+
+    @timed("login.login_checked")
+    def login_checked(self, username, password, user_id, stored, valid):
+        self.set_busy(False)
+        if not valid:
+            self.throttle.failed(username)
             QMessageBox.warning(self, "Login Failed", "Invalid username or password!")
-
+            return
+        self.throttle.succeeded(username)
+        self.credentials.remember(username, stored, password)
+        if needs_rehash(stored):
+            # Upgrade the hash in the background; if the pool is busy, the next login tries again.
+            self.passwords.run(
+                hash_password, password, callback=lambda new_hash: self.rehash_done(username, password, user_id, stored, new_hash)
+            )
+        self.login_success_callback(user_id)
+
+    ''' Stores a user's password hash again with the current KDF settings. '''
+    def rehash_done(self, username, password, user_id, old_hash, new_hash):
+        self.service.write(
+            _update_password, user_id, old_hash, new_hash,
+            callback=lambda _: self.credentials.remember(username, new_hash, password)
+        )
+
+    def login_error(self, error):
+        self.set_busy(False)
+        QMessageBox.warning(self, "Login Failed", f"An error occurred: {error}")
+
+    @timed("login.handle_register")
     def handle_register(self):
         """
-        Registers a new user. The password entered by the user is hashed using SHA-256
-        before being stored in the database.
+        Registers a new user. The password entered by the user is hashed with a salted KDF
+        on the password thread pool before being stored in the database.
         """
         username = self.register_username_input.text().strip()
         password = self.register_password_input.text().strip()
         if not username or not password:
             QMessageBox.warning(self, "Input Error", "Please enter both username and password!")
             return
-        hashed_password = hash_password(password)
-        c = self.conn.cursor()
-        try:
-            c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-            self.conn.commit()
-            QMessageBox.information(self, "Registration Successful",
-                                    "You have registered successfully! You can now login.")
-        except Exception:
-            QMessageBox.warning(self, "Registration Failed", "Username already exists!")
+        self.set_busy(True)
+        future = self.passwords.run(
+            hash_password, password,
+            callback=lambda hashed_password: self.service.write(
+                _create_user, username, hashed_password,
+                callback=self.registration_done, error_callback=self.registration_failed
+            ),
+            error_callback=self.registration_failed
+        )
+        if future is None:
+            self.set_busy(False)
+            QMessageBox.warning(self, "Registration Failed", "Too many requests at once. Please wait a moment.")
+
+    @timed("login.registration_done")
+    def registration_done(self, result):
+        self.set_busy(False)
+        QMessageBox.information(self, "Registration Successful",
+                                "You have registered successfully! You can now login.")
+
+    def registration_failed(self, error):
+        self.set_busy(False)
+        QMessageBox.warning(self, "Registration Failed", "Username already exists!")
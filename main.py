@@ -1,24 +1,65 @@
+import time
+STARTED = time.perf_counter()
+
+import argparse
 import sys
-from PyQt5.QtWidgets import QApplication, QMainWindow, QStackedWidget
-from PyQt5.QtCore import Qt
-from database import init_db
+from PyQt5.QtWidgets import QMainWindow, QStackedWidget, QShortcut
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QKeySequence
+import profiling
+from database import DB_PATH
+from db_service import DatabaseService
 from login_register import LoginRegisterWidget
-from dashboard import DashboardWidget
+from recurring import RecurringScheduler
+
+IMPORTED = time.perf_counter()
 
-''' The main application window that manages the login/register and dashboard views. '''
+''' The main application window that manages the login/register and dashboard views.
+    Only the login form is built up front. The dashboard, and the modules behind it, are loaded
+    once the window has been shown, while the user is typing, and that one dashboard is re-bound
+    to each user who logs in. '''
 class MainWindow(QMainWindow):
-    def __init__(self, conn):
+    dashboard_built = pyqtSignal()
+
+    def __init__(self, service):
         super().__init__()
-        self.conn = conn
+        self.service = service
         self.current_user_id = None
         self.setWindowTitle("Expense Tracker")
         self.stack = QStackedWidget()
-        self.login_register_widget = LoginRegisterWidget(conn, self.login_success)
+        self.login_register_widget = LoginRegisterWidget(service, self.login_success)
         self.stack.addWidget(self.login_register_widget)
         self.dashboard = None
+        self.dashboard_scheduled = False
         self.setCentralWidget(self.stack)
         self.set_login_register_size()
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowMaximizeButtonHint)
+        # Adds due recurring expenses now, catching up on any missed while the app was closed, and then periodically.
+        self.recurring_scheduler = RecurringScheduler(service, self)
+        self.recurring_scheduler.materialized.connect(self.recurring_materialized)
+        self.recurring_scheduler.start()
+        self.performance_overlay = None
+        if profiling.ENABLED:
+            # F12 toggles the timings overlay when EXPENSE_TRACKER_PROFILE is set.
+            self.performance_overlay = profiling.PerformanceOverlay(self)
+            QShortcut(QKeySequence(Qt.Key_F12), self, activated=self.performance_overlay.toggle)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.dashboard_scheduled:
+            # Build the dashboard on the next pass of the event loop, after the login form is on screen.
+            self.dashboard_scheduled = True
+            QTimer.singleShot(0, self.build_dashboard)
+
+    ''' Creates the dashboard without a user, if it doesn't exist yet. '''
+    @profiling.timed("main.build_dashboard")
+    def build_dashboard(self):
+        if self.dashboard is not None:
+            return
+        from dashboard import DashboardWidget
+        self.dashboard = DashboardWidget(self.service, None, logout_callback=self.logout)
+        self.stack.addWidget(self.dashboard)
+        self.dashboard_built.emit()
 
     ''' Sets the fixed size of the main window to 250x300 for the login/register view. '''
     def set_login_register_size(self):
@@ -31,29 +72,52 @@ class MainWindow(QMainWindow):
         if self.dashboard:
             self.dashboard.setFixedSize(800, 600)
 
-    ''' Called when a user logs in successfully. Sets up the dashboard view and switches to it.
+    ''' Called when a user logs in successfully. Binds the dashboard to the user and switches to it.
 
         :param user_id: The ID of the logged-in user. '''
     def login_success(self, user_id):
         self.current_user_id = user_id
+        self.build_dashboard()
         self.set_dashboard_size()
-        self.dashboard = DashboardWidget(self.conn, self.current_user_id, logout_callback=self.logout)
-        self.stack.addWidget(self.dashboard)
+        self.dashboard.set_user(user_id)
         self.stack.setCurrentWidget(self.dashboard)
 
-    ''' Called when the user logs out. Removes the dashboard view and switches back to the login/register view. '''
+    ''' Reloads the dashboard if the scheduler added recurring expenses for the logged-in user.
+
+        :param added: A dict of the number of expenses added per user ID. '''
+    def recurring_materialized(self, added):
+        if self.dashboard is not None and self.current_user_id in added:
+            self.dashboard.load_expenses()
+
+    ''' Called when the user logs out. Empties the dashboard and switches back to the login/register view. '''
     def logout(self):
         self.current_user_id = None
-        self.stack.removeWidget(self.dashboard)
-        self.dashboard.deleteLater()
-        self.dashboard = None
+        self.dashboard.set_user(None)
         self.stack.setCurrentWidget(self.login_register_widget)
         self.set_login_register_size()
 
 
 if __name__ == "__main__":
-    conn = init_db()
-    app = QApplication(sys.argv)
-    window = MainWindow(conn)
+    parser = argparse.ArgumentParser(description="Expense Tracker")
+    parser.add_argument("--db", default=DB_PATH, help="Database file to open.")
+    parser.add_argument("--shared", action="store_true", help="The database file is used by other running trackers too.")
+    parser.add_argument("--startup-timing", action="store_true", help="Print startup timings and quit.")
+    # Anything not recognized here is left for Qt, such as -platform.
+    args, qt_args = parser.parse_known_args()
+    app = profiling.application_class()(sys.argv[:1] + qt_args)
+    profiling.start()
+    app.aboutToQuit.connect(profiling.dump)
+    startup = None
+    if args.startup_timing:
+        # Reports startup timings, then quits once the dashboard has been built.
+        startup = profiling.StartupTimer(STARTED)
+        startup.mark("imports_ms", IMPORTED)
+    service = DatabaseService(args.db, shared=args.shared)
+    app.aboutToQuit.connect(service.shutdown)
+    window = MainWindow(service)
+    if startup is not None:
+        startup.mark("window_created_ms")
+        startup.watch_first_paint(window)
+        window.dashboard_built.connect(lambda: (startup.mark("dashboard_built_ms"), startup.report(), app.quit()))
     window.show()
     sys.exit(app.exec_())
@@ -0,0 +1,142 @@
+''' Maintenance commands for the expense tracker database, run from the command line:
+
+        python manage.py rebuild-summaries
+        python manage.py report --user alice --by year
+        python manage.py archive --keep-years 2
+        python manage.py vacuum
+        python manage.py backup --dir backups
+        python manage.py restore --dir backups '''
+
+import argparse
+import datetime
+from archive import archive_expenses, compact
+from backup import BackupError, backup, full_backup, list_backups, restore, verify
+from database import DB_PATH, init_db, rebuild_summaries
+from money import format_cents
+
+''' Recomputes the monthly and per-name summary tables from the expenses table. '''
+def rebuild_summaries_command(conn, args):
+    c = conn.cursor()
+    c.execute("BEGIN")
+    try:
+        rebuild_summaries(c)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print("Summary tables rebuilt.")
+
+''' Prints a user's exact spending per period and overall, computed with NumPy from integer cents. '''
+def report_command(conn, args):
+    # NumPy is only needed for reports, so the GUI runs without it.
+    from ledger import load_ledger
+    row = conn.execute("SELECT id FROM users WHERE username=?", (args.user,)).fetchone()
+    if row is None:
+        raise SystemExit(f"No user named {args.user!r}.")
+    ledger = load_ledger(conn, row[0], args.date_from, args.date_to)
+    unit = {"day": "D", "week": "W", "month": "M", "year": "Y"}[args.by]
+    for period, cents, count in zip(*ledger.totals_by(unit)):
+        print(f"{str(period):<12}{int(count):>8}  {format_cents(int(cents)):>16}")
+    print(f"{'Total':<12}{len(ledger):>8}  {format_cents(ledger.total()):>16}")
+
+''' Moves expenses from before the kept years into per-year archive tables. '''
+def archive_command(conn, args):
+    before_year = args.before or datetime.date.today().year - args.keep_years + 1
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        archived = archive_expenses(c, before_year)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for year, count in archived.items():
+        print(f"{year}: {count} expenses archived.")
+    print(f"Expenses from before {before_year} are archived. Run 'vacuum' to reclaim their space.")
+
+''' Compacts the database file and prints how much space it reclaimed. '''
+def vacuum_command(conn, args):
+    before, after = compact(conn, args.db)
+    print(f"{before:,} bytes before, {after:,} bytes after; {before - after:,} bytes reclaimed.")
+
+''' Backs up the database, incrementally unless --full is given or there is no backup to continue from. '''
+def backup_command(conn, args):
+    # The backup opens its own connections.
+    conn.close()
+    try:
+        manifest = full_backup(args.db, args.dir) if args.full else backup(args.db, args.dir)
+    except BackupError as e:
+        raise SystemExit(f"Backup failed: {e}")
+    print(f"{manifest['kind'].capitalize()} backup {manifest['name']} written and verified.")
+
+''' Lists the backups in a directory. '''
+def list_backups_command(conn, args):
+    try:
+        manifests = list_backups(args.dir)
+    except BackupError as e:
+        raise SystemExit(str(e))
+    for manifest in manifests:
+        users = len(manifest["checksums"])
+        print(f"{manifest['name']:<36}{manifest['kind']:<13}{manifest['created']}  {users} users")
+
+''' Rebuilds a backup in a temporary file and checks its integrity and checksums. '''
+def verify_command(conn, args):
+    try:
+        chain = verify(args.dir, args.name)
+    except BackupError as e:
+        raise SystemExit(f"Verification failed: {e}")
+    print(f"{chain[-1]['name']} is restorable ({len(chain)} backups in its chain).")
+
+''' Replaces the database with a backup. '''
+def restore_command(conn, args):
+    conn.close()
+    try:
+        chain = restore(args.dir, args.db, args.name)
+    except BackupError as e:
+        raise SystemExit(f"Restore failed: {e}")
+    print(f"Restored {chain[-1]['name']} from {', '.join(m['name'] for m in chain)}.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Expense tracker database maintenance.")
+    parser.add_argument("--db", default=DB_PATH, help="Path of the database file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "rebuild-summaries", help="Recompute the monthly and per-name totals."
+    ).set_defaults(handler=rebuild_summaries_command)
+    report = commands.add_parser("report", help="Print a user's spending per period.")
+    report.add_argument("--user", required=True, help="Username to report on.")
+    report.add_argument("--by", choices=["day", "week", "month", "year"], default="month")
+    report.add_argument("--from", dest="date_from", help="Earliest date, as yyyy-mm-dd.")
+    report.add_argument("--to", dest="date_to", help="Latest date, as yyyy-mm-dd.")
+    report.set_defaults(handler=report_command)
+    archive = commands.add_parser("archive", help="Move old expenses into per-year archive tables.")
+    archive.add_argument("--keep-years", type=int, default=2, help="Recent years to keep, including this one.")
+    archive.add_argument("--before", type=int, help="Archive every year before this one instead.")
+    archive.set_defaults(handler=archive_command)
+    commands.add_parser(
+        "vacuum", help="Compact the database file. Run it while the tracker is closed."
+    ).set_defaults(handler=vacuum_command)
+    backup_parser = commands.add_parser("backup", help="Back up the database. Can run while the tracker is open.")
+    backup_parser.add_argument("--dir", required=True, help="Backup directory.")
+    backup_parser.add_argument("--full", action="store_true", help="Take a full snapshot even if an incremental would do.")
+    backup_parser.set_defaults(handler=backup_command)
+    list_parser = commands.add_parser("list-backups", help="List the backups in a directory.")
+    list_parser.add_argument("--dir", required=True, help="Backup directory.")
+    list_parser.set_defaults(handler=list_backups_command)
+    verify_parser = commands.add_parser("verify", help="Check that a backup can be restored.")
+    verify_parser.add_argument("--dir", required=True, help="Backup directory.")
+    verify_parser.add_argument("--name", help="Backup to check. Defaults to the newest.")
+    verify_parser.set_defaults(handler=verify_command)
+    restore_parser = commands.add_parser("restore", help="Replace the database with a backup. Close the tracker first.")
+    restore_parser.add_argument("--dir", required=True, help="Backup directory.")
+    restore_parser.add_argument("--name", help="Backup to restore. Defaults to the newest.")
+    restore_parser.set_defaults(handler=restore_command)
+    args = parser.parse_args(argv)
+    conn = init_db(args.db)
+    try:
+        args.handler(conn, args)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Expense costs are stored and summed as integer cents so totals are exact.
+
+''' Parses a cost such as "12.5", "$1,024.99" or 3.25 into integer cents, rounding half-cents up.
+    Raises ValueError if the value isn't a number. '''
+def parse_cents(value):
+    if isinstance(value, int):
+        return value * 100
+    text = str(value).strip().replace("$", "").replace(",", "")
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Invalid cost: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid cost: {value!r}")
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+''' Formats cents as a plain decimal amount for editing, e.g. 1250 -> "12.50". '''
+def cents_to_text(cents):
+    sign = "-" if cents < 0 else ""
+    dollars, remainder = divmod(abs(cents), 100)
+    return f"{sign}{dollars}.{remainder:02d}"
+
+''' Formats cents as a dollar amount for display, e.g. 123450 -> "$1,234.50". '''
+def format_cents(cents):
+    sign = "-" if cents < 0 else ""
+    dollars, remainder = divmod(abs(cents), 100)
+    return f"{sign}${dollars:,}.{remainder:02d}"
@@ -0,0 +1,180 @@
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# Passwords are stored as "scrypt$n$r$p$salt$hash", with a random salt per user. Where Python's
+# OpenSSL lacks scrypt, PBKDF2-SHA256 is used instead, stored as "pbkdf2_sha256$iterations$salt$hash".
+# Hashes from before either are a bare hex SHA-256 digest; they still verify and are replaced on login.
+SCRYPT_N = 2 ** 15  # About 32 MiB of memory and 0.1 s of CPU per hash.
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * r * n + 1024 * 1024, dklen=KEY_BYTES
+    )
+
+''' Hashes a password with a memory-hard KDF and a new random salt, returning the string to store.
+    This takes around a tenth of a second on purpose, so call it off the GUI thread. '''
+def hash_password(password: str) -> str:
+    salt = os.urandom(SALT_BYTES)
+    if hasattr(hashlib, "scrypt"):
+        key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}"
+    key = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS, KEY_BYTES)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(key)}"
+
+''' Returns whether a stored hash was made with older or weaker settings than hash_password() uses now. '''
+def needs_rehash(stored):
+    if hasattr(hashlib, "scrypt"):
+        return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not stored.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+''' Checks a password against a stored hash in constant time. Takes as long as hash_password(). '''
+def verify_password(password: str, stored: str) -> bool:
+    scheme, _, rest = stored.partition("$")
+    try:
+        if scheme == "scrypt":
+            n, r, p, salt, key = rest.split("$")
+            candidate = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+        elif scheme == "pbkdf2_sha256":
+            iterations, salt, key = rest.split("$")
+            candidate = hashlib.pbkdf2_hmac(
+                "sha256", password.encode("utf-8"), base64.b64decode(salt), int(iterations), KEY_BYTES
+            )
+        else:
+            # An unsalted SHA-256 digest from before passwords were salted.
+            return hmac.compare_digest(hashlib.sha256(password.encode("utf-8")).hexdigest(), stored)
+    except ValueError:
+        return False
+    return hmac.compare_digest(candidate, base64.b64decode(key))
+
+_dummy_hash = None
+
+''' Returns a hash of no real password, for verifying against when a username doesn't exist, so
+    that unknown usernames take as long to reject as wrong passwords. '''
+def dummy_hash():
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(os.urandom(SALT_BYTES).hex())
+    return _dummy_hash
+
+''' Verifies a password against a user's stored hash, or against a dummy hash when there is no such
+    user (stored is None), in which case it always fails after the same amount of work. '''
+def check_password(password, stored):
+    if stored is None:
+        verify_password(password, dummy_hash())
+        return False
+    return verify_password(password, stored)
+
+''' Remembers the users who logged in successfully during this session, so logging in again
+    after a logout skips the KDF. Entries hold an HMAC of the password under a key that only
+    exists in this process's memory, never the password, and a hit also requires the stored hash
+    to be unchanged. Safe to use from any thread. '''
+class CredentialCache:
+    def __init__(self, size=32):
+        self.size = size
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, password):
+        return hmac.new(self._key, password.encode("utf-8"), hashlib.sha256).digest()
+
+    def remember(self, username, stored, password):
+        with self._lock:
+            self._entries[username] = (stored, self._digest(password))
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def matches(self, username, stored, password):
+        with self._lock:
+            entry = self._entries.get(username)
+        return entry is not None and entry[0] == stored and hmac.compare_digest(entry[1], self._digest(password))
+
+''' Slows down password guessing for a username: after FREE_ATTEMPTS failures in a row, each
+    further attempt has to wait twice as long as the last, up to MAX_DELAY seconds. '''
+class LoginThrottle:
+    FREE_ATTEMPTS = 3
+    BASE_DELAY = 1.0
+    MAX_DELAY = 300.0
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._failures = {}  # Username: (failures in a row, time of the last failure).
+
+    ''' Returns the seconds left before the username may try again, or 0 if it may try now. '''
+    def retry_after(self, username):
+        failures, last = self._failures.get(username.lower(), (0, 0.0))
+        if failures < self.FREE_ATTEMPTS:
+            return 0
+        delay = min(self.BASE_DELAY * 2 ** (failures - self.FREE_ATTEMPTS), self.MAX_DELAY)
+        return max(0, last + delay - self.clock())
+
+    def failed(self, username):
+        failures, _ = self._failures.get(username.lower(), (0, 0.0))
+        self._failures[username.lower()] = (failures + 1, self.clock())
+
+    def succeeded(self, username):
+        self._failures.pop(username.lower(), None)
+
+''' Runs password hashing and verification on a small thread pool, off the GUI thread.
+    At most max_pending jobs are accepted at a time, so repeated attempts can't queue up enough
+    KDF work to saturate the CPU. Callbacks run on the thread this object lives in, as with
+    DatabaseService. '''
+class PasswordService(QObject):
+    _job_done = pyqtSignal(object, object)  # Callback, result or exception.
+
+    def __init__(self, workers=2, max_pending=4, parent=None):
+        super().__init__(parent)
+        self.max_pending = max_pending
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        # The KDFs release the GIL while they run, so threads hash in parallel.
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._job_done.connect(self._run_callback)
+
+    ''' Runs job(*args) on the pool.
+
+        :return: A Future for the job's result, or None if too many jobs are already pending. '''
+    def run(self, job, *args, callback=None, error_callback=None):
+        with self._pending_lock:
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+        future = self._executor.submit(job, *args)
+        future.add_done_callback(lambda f: self._finish(f, callback, error_callback))
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _finish(self, future, callback, error_callback):
+        with self._pending_lock:
+            self._pending -= 1
+        error = future.exception()
+        if error is None:
+            if callback is not None:
+                self._job_done.emit(callback, future.result())
+        else:
+            self._job_done.emit(error_callback or self._report_error, error)
+
+    def _run_callback(self, callback, value):
+        callback(value)
+
+    def _report_error(self, error):
+        sys.excepthook(type(error), error, error.__traceback__)
@@ -0,0 +1,250 @@
+''' Hot-path instrumentation for the expense tracker.
+
+    Set EXPENSE_TRACKER_PROFILE to an output path prefix to turn it on, for example:
+
+        EXPENSE_TRACKER_PROFILE=profile python main.py
+
+    While enabled, wrapped handlers, SQL statements and Qt paint/layout events are timed, F12
+    toggles an overlay of the slowest entries, and on exit the timings are written to
+    <prefix>.json and a cProfile of the GUI thread to <prefix>.pstats. When the variable is
+    unset, timed() returns functions unchanged and connections are not wrapped, so there is no cost. '''
+
+import cProfile
+import functools
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from PyQt5.QtCore import QEvent, QObject, QTimer, Qt
+from PyQt5.QtWidgets import QApplication, QLabel
+
+PROFILE_PREFIX = os.environ.get("EXPENSE_TRACKER_PROFILE")
+ENABLED = bool(PROFILE_PREFIX)
+
+''' Accumulated timings per name: call count, total and slowest duration. Safe to update from any thread. '''
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self._entries[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+
+    ''' Returns (name, count, total seconds, max seconds) rows, largest total first. '''
+    def snapshot(self):
+        with self._lock:
+            rows = [(name, *entry) for name, entry in self._entries.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+stats = Stats()
+
+''' Times a block or a function under a name. Use as a context manager or as a decorator:
+
+        with timed("export.write_rows"):
+            ...
+
+        @timed("dashboard.load_expenses")
+        def load_expenses(self):
+            ... '''
+class timed:
+    def __init__(self, name):
+        self.name = name
+        self._started = []
+
+    def __enter__(self):
+        self._started.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc_info):
+        if ENABLED:
+            stats.record(self.name, time.perf_counter() - self._started.pop())
+        return False
+
+    def __call__(self, func):
+        if not ENABLED:
+            return func
+        name = self.name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.record(name, time.perf_counter() - started)
+        return wrapper
+
+_WHITESPACE = re.compile(r"\s+")
+
+def _statement_name(sql):
+    return "sql: " + _WHITESPACE.sub(" ", sql).strip()
+
+''' A cursor that records the time each statement spends executing and fetching its rows. '''
+class ProfiledCursor(sqlite3.Cursor):
+    _statement = "sql: (no statement)"
+
+    def _timed_call(self, name, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            stats.record(name, time.perf_counter() - started)
+
+    def execute(self, sql, parameters=()):
+        self._statement = _statement_name(sql)
+        return self._timed_call(self._statement, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._statement = _statement_name(sql)
+        return self._timed_call(self._statement, super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._timed_call(self._statement, super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_call(self._statement, super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._timed_call(self._statement, super().fetchall)
+
+''' A connection whose cursors are ProfiledCursors. SQLite's trace hook also counts every
+    nested statement SQLite runs on behalf of another, such as trigger and FTS5 index updates. '''
+class ProfiledConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(self._trace)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _trace(self, statement):
+        if statement.startswith("-- "):
+            stats.record("sql nested: " + _WHITESPACE.sub(" ", statement[3:]).strip(), 0.0)
+
+''' Returns the sqlite3.connect factory to use: ProfiledConnection when profiling is on. '''
+def connection_factory():
+    return ProfiledConnection if ENABLED else sqlite3.Connection
+
+''' A QApplication that records how long paint and layout events take to handle. '''
+class ProfiledApplication(QApplication):
+    TIMED_EVENTS = {QEvent.Paint: "qt: paint", QEvent.LayoutRequest: "qt: layout"}
+
+    def notify(self, receiver, event):
+        name = self.TIMED_EVENTS.get(event.type())
+        if name is None:
+            return super().notify(receiver, event)
+        started = time.perf_counter()
+        try:
+            return super().notify(receiver, event)
+        finally:
+            stats.record(name, time.perf_counter() - started)
+
+''' Returns the QApplication class to create: ProfiledApplication when profiling is on. '''
+def application_class():
+    return ProfiledApplication if ENABLED else QApplication
+
+''' A translucent panel listing the slowest instrumented entries, refreshed while visible. '''
+class PerformanceOverlay(QLabel):
+    ROWS = 15
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setTextFormat(Qt.PlainText)
+        self.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 190); color: #9f9; font-family: monospace; padding: 6px;"
+        )
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def toggle(self):
+        if self.isVisible():
+            self.refresh_timer.stop()
+            self.hide()
+        else:
+            self.refresh()
+            self.refresh_timer.start()
+            self.show()
+            self.raise_()
+
+    def refresh(self):
+        lines = [f"{'total ms':>9} {'max ms':>8} {'calls':>6}  name"]
+        for name, count, total, slowest in stats.snapshot()[:self.ROWS]:
+            lines.append(f"{total * 1000:9.1f} {slowest * 1000:8.1f} {count:6d}  {name[:70]}")
+        self.setText("\n".join(lines))
+        self.adjustSize()
+        self.setFixedWidth(self.parentWidget().width())
+
+''' Records how long startup takes, in milliseconds since the process started, and prints the
+    marks as JSON to stderr. main.py turns it on with --startup-timing. For a per-module breakdown
+    of the import time, run with python -X importtime as well. '''
+class StartupTimer(QObject):
+    def __init__(self, started, parent=None):
+        super().__init__(parent)
+        self.started = started
+        self.marks = {}
+
+    ''' Records the time a startup step finished. Only the first mark of each name counts. '''
+    def mark(self, name, at=None):
+        if name not in self.marks:
+            self.marks[name] = ((time.perf_counter() if at is None else at) - self.started) * 1000
+
+    ''' Marks first_paint_ms the first time a widget paints. '''
+    def watch_first_paint(self, widget):
+        widget.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint:
+            watched.removeEventFilter(self)
+            self.mark("first_paint_ms")
+        return False
+
+    def report(self):
+        json.dump(self.marks, sys.stderr, indent=2)
+        sys.stderr.write("\n")
+
+_profiler = None
+
+''' Starts profiling the calling (GUI) thread with cProfile, if enabled. '''
+def start():
+    global _profiler
+    if not ENABLED or _profiler is not None:
+        return
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+''' Writes the collected timings to <prefix>.json and the cProfile data to <prefix>.pstats. '''
+def dump():
+    if not ENABLED:
+        return
+    with open(PROFILE_PREFIX + ".json", "w") as f:
+        json.dump([
+            {"name": name, "calls": count, "total_ms": total * 1000, "max_ms": slowest * 1000}
+            for name, count, total, slowest in stats.snapshot()
+        ], f, indent=2)
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(PROFILE_PREFIX + ".pstats")
+        _profiler.enable()
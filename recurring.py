@@ -0,0 +1,378 @@
+import sys
+from calendar import monthrange
+from datetime import date, timedelta
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLineEdit, QComboBox, QSpinBox, QDateEdit,
+    QCheckBox, QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QMessageBox
+)
+from PyQt5.QtCore import QObject, QDate, QTimer, pyqtSignal
+from formatting import display_cents, display_date
+from money import parse_cents
+from profiling import timed
+
+FREQUENCIES = ["daily", "weekly", "monthly", "yearly"]
+_UNITS = {"daily": "day", "weekly": "week", "monthly": "month", "yearly": "year"}
+
+''' Returns the date of a rule's occurrence number `n`, counting the start date as occurrence 0.
+    Monthly and yearly rules keep the start date's day, falling back to the last day of shorter
+    months, so a rule starting on January 31st is due on February 28th and then March 31st. '''
+def occurrence_date(start, frequency, interval, n):
+    if frequency == "daily":
+        return start + timedelta(days=interval * n)
+    if frequency == "weekly":
+        return start + timedelta(weeks=interval * n)
+    months = interval * n * (12 if frequency == "yearly" else 1)
+    year, month = divmod(start.month - 1 + months, 12)
+    year += start.year
+    return date(year, month + 1, min(start.day, monthrange(year, month + 1)[1]))
+
+''' Parses an RRULE-style rule such as "FREQ=WEEKLY;INTERVAL=2;COUNT=10" or
+    "FREQ=MONTHLY;UNTIL=20251231". Supports the FREQ, INTERVAL, COUNT and UNTIL parts.
+
+    :return: Tuple of (frequency, interval, until_date as yyyy-mm-dd or None, max_count or None).
+    :raises ValueError: If the rule is malformed or uses unsupported parts. '''
+def parse_rule(text):
+    text = text.strip().upper()
+    if text.startswith("RRULE:"):
+        text = text[len("RRULE:"):]
+    parts = {}
+    for part in text.split(";"):
+        if not part:
+            continue
+        key, separator, value = part.partition("=")
+        if not separator or not value:
+            raise ValueError(f"Invalid rule part: {part!r}")
+        parts[key] = value
+    unsupported = set(parts) - {"FREQ", "INTERVAL", "COUNT", "UNTIL"}
+    if unsupported:
+        raise ValueError(f"Unsupported rule parts: {', '.join(sorted(unsupported))}")
+    frequency = parts.get("FREQ", "").lower()
+    if frequency not in FREQUENCIES:
+        raise ValueError("FREQ must be DAILY, WEEKLY, MONTHLY or YEARLY")
+    interval = int(parts.get("INTERVAL", 1))
+    max_count = int(parts["COUNT"]) if "COUNT" in parts else None
+    if interval < 1 or (max_count is not None and max_count < 1):
+        raise ValueError("INTERVAL and COUNT must be positive")
+    until_date = None
+    if "UNTIL" in parts:
+        until = parts["UNTIL"][:8]
+        until_date = date(int(until[:4]), int(until[4:6]), int(until[6:8])).isoformat()
+    return frequency, interval, until_date, max_count
+
+''' Describes a rule for display, e.g. "Every 2 weeks, 10 times". '''
+def describe_rule(frequency, interval, until_date=None, max_count=None):
+    unit = _UNITS[frequency]
+    text = f"Every {unit}" if interval == 1 else f"Every {interval} {unit}s"
+    if max_count is not None:
+        text += f", {max_count} times"
+    if until_date is not None:
+        text += f", until {display_date(until_date)}"
+    return text
+
+''' Adds a recurring expense rule. Its first occurrence is due on the start date. Runs on the database writer thread. '''
+def add_rule(conn, user_id, name, cost_cents, description, frequency, interval, start_date, until_date, max_count):
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO recurring_expenses (user_id, name, cost_cents, description, frequency, interval, "
+        "start_date, until_date, max_count, next_due) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (user_id, name, cost_cents, description, frequency, interval, start_date, until_date, max_count,
+         start_date if until_date is None or start_date <= until_date else None)
+    )
+    return c.lastrowid
+
+''' Adds a recurring expense rule and then every expense due on or before `today`, in one job on the
+    database writer thread, so the rule's occurrences up to today are added in the same transaction.
+
+    :param rule: The arguments of add_rule after the connection.
+    :return: A dict of the number of expenses added per user ID, as from materialize_due. '''
+def add_rule_and_materialize(conn, today, *rule):
+    add_rule(conn, *rule)
+    return materialize_due(conn, today)
+
+''' Deletes a recurring expense rule. Expenses it has already added are kept. Runs on the database writer thread. '''
+def delete_rule(conn, user_id, rule_id):
+    conn.execute("DELETE FROM recurring_expenses WHERE id=? AND user_id=?", (rule_id, user_id))
+
+''' Returns a user's rules as (id, name, cost_cents, frequency, interval, until_date, max_count, next_due) rows. '''
+def user_rules(conn, user_id):
+    c = conn.cursor()
+    c.execute(
+        "SELECT id, name, cost_cents, frequency, interval, until_date, max_count, next_due "
+        "FROM recurring_expenses WHERE user_id=? ORDER BY next_due IS NULL, next_due, id",
+        (user_id,)
+    )
+    return c.fetchall()
+
+''' Adds an expense for every occurrence of every rule that is due on or before `today`, and
+    moves each rule's next_due past them. Runs on the database writer thread, so it happens in one
+    transaction and an occurrence is never added twice, even by several processes.
+    The due rules are found through the next_due index, so the cost depends on the rules due, not on
+    the number of rules or expenses, and catching up after a long downtime is one batched insert.
+
+    :param today: The current date, as yyyy-mm-dd.
+    :return: A dict of the number of expenses added per user ID. '''
+def materialize_due(conn, today):
+    c = conn.cursor()
+    c.execute(
+        "SELECT id, user_id, name, cost_cents, description, frequency, interval, start_date, until_date, "
+        "max_count, occurrences FROM recurring_expenses WHERE next_due <= ?",
+        (today,)
+    )
+    rules = c.fetchall()
+    expenses = []
+    progress = []
+    added = {}
+    end = date.fromisoformat(today)
+    for (rule_id, user_id, name, cost_cents, description, frequency, interval, start_date, until_date,
+         max_count, occurrences) in rules:
+        start = date.fromisoformat(start_date)
+        until = date.fromisoformat(until_date) if until_date else None
+        last = min(end, until) if until else end
+        n = occurrences
+        due = occurrence_date(start, frequency, interval, n)
+        while due <= last and (max_count is None or n < max_count):
+            expenses.append((user_id, name, cost_cents, due.isoformat(), description))
+            n += 1
+            due = occurrence_date(start, frequency, interval, n)
+        finished = (max_count is not None and n >= max_count) or (until is not None and due > until)
+        progress.append((n, None if finished else due.isoformat(), rule_id))
+        added[user_id] = added.get(user_id, 0) + n - occurrences
+    c.executemany(
+        "INSERT INTO expenses (user_id, name, cost_cents, date, description) VALUES (?, ?, ?, ?, ?)", expenses
+    )
+    c.executemany("UPDATE recurring_expenses SET occurrences=?, next_due=? WHERE id=?", progress)
+    return {user_id: count for user_id, count in added.items() if count}
+
+''' Adds due recurring expenses for every user when started and then periodically, on the
+    DatabaseService writer. Emits materialized with a dict of expenses added per user ID whenever
+    a run added any. '''
+class RecurringScheduler(QObject):
+    materialized = pyqtSignal(object)
+    INTERVAL_MS = 15 * 60 * 1000
+
+    def __init__(self, service, parent=None):
+        super().__init__(parent)
+        self.service = service
+        self._running = False
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.INTERVAL_MS)
+        self.timer.timeout.connect(self.run)
+
+    ''' Catches up on everything due since the last run, then keeps checking on the timer. '''
+    def start(self):
+        self.run()
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    ''' Materializes everything due today, unless a run is already in progress. '''
+    def run(self):
+        if self._running:
+            return
+        self._running = True
+        self.service.write(
+            materialize_due, date.today().isoformat(), callback=self._finished, error_callback=self._failed
+        )
+
+    @timed("recurring.materialized")
+    def _finished(self, added):
+        self._running = False
+        if added:
+            self.materialized.emit(added)
+
+    def _failed(self, error):
+        self._running = False
+        sys.excepthook(type(error), error, error.__traceback__)
+
+''' A dialog listing a user's recurring expenses, with a form to add rules and a button to delete them.
+    After a rule is added, its occurrences up to today are added as expenses straight away.
+    materialized_callback is called with a dict of the expenses added per user ID, even if the
+    dialog has closed by the time they are saved. '''
+class RecurringDialog(QDialog):
+    CUSTOM = "Custom rule"
+
+    def __init__(self, service, user_id, materialized_callback, parent=None):
+        super().__init__(parent)
+        self.service = service
+        self.user_id = user_id
+        self.materialized_callback = materialized_callback
+        self.rules = []
+        self.rules_table = None
+        self.name_input = None
+        self.cost_input = None
+        self.description_input = None
+        self.frequency_input = None
+        self.interval_input = None
+        self.rule_input = None
+        self.start_date_input = None
+        self.until_enabled = None
+        self.until_date_input = None
+        self.add_button = None
+        self.delete_button = None
+        self.closed = False
+        self.setWindowTitle("Recurring Expenses")
+        self.resize(700, 450)
+        self.init_ui()
+        self.load_rules()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        self.rules_table = QTableWidget(0, 4)
+        self.rules_table.setHorizontalHeaderLabels(["Name", "Cost", "Repeats", "Next Due"])
+        self.rules_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.rules_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.rules_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.rules_table.verticalHeader().setVisible(False)
+        self.rules_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.rules_table.itemSelectionChanged.connect(
+            lambda: self.delete_button.setEnabled(bool(self.rules_table.selectedItems()))
+        )
+
+        form_layout = QFormLayout()
+        self.name_input = QLineEdit()
+        self.cost_input = QLineEdit()
+        self.description_input = QLineEdit()
+        self.frequency_input = QComboBox()
+        self.frequency_input.addItems([frequency.capitalize() for frequency in FREQUENCIES] + [self.CUSTOM])
+        self.frequency_input.setCurrentIndex(FREQUENCIES.index("monthly"))
+        self.frequency_input.currentTextChanged.connect(self.update_rule_inputs)
+        self.interval_input = QSpinBox()
+        self.interval_input.setRange(1, 365)
+        self.rule_input = QLineEdit()
+        self.rule_input.setPlaceholderText("e.g. FREQ=WEEKLY;INTERVAL=2;COUNT=10")
+        self.start_date_input = QDateEdit(calendarPopup=True)
+        self.start_date_input.setDate(QDate.currentDate())
+        self.until_enabled = QCheckBox("Ends on")
+        self.until_date_input = QDateEdit(calendarPopup=True)
+        self.until_date_input.setDate(QDate.currentDate().addYears(1))
+        self.until_date_input.setEnabled(False)
+        self.until_enabled.toggled.connect(self.until_date_input.setEnabled)
+        until_layout = QHBoxLayout()
+        until_layout.addWidget(self.until_enabled)
+        until_layout.addWidget(self.until_date_input)
+        form_layout.addRow("Name:", self.name_input)
+        form_layout.addRow("Cost:", self.cost_input)
+        form_layout.addRow("Description:", self.description_input)
+        form_layout.addRow("Repeats:", self.frequency_input)
+        form_layout.addRow("Every:", self.interval_input)
+        form_layout.addRow("Rule:", self.rule_input)
+        form_layout.addRow("Starts on:", self.start_date_input)
+        form_layout.addRow("", until_layout)
+        self.update_rule_inputs()
+
+        self.add_button = QPushButton("Add Recurring Expense")
+        self.add_button.clicked.connect(self.add_rule)
+        self.delete_button = QPushButton("Delete Selected")
+        self.delete_button.clicked.connect(self.delete_rule)
+        self.delete_button.setEnabled(False)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.accept)
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.add_button)
+        button_layout.addWidget(self.delete_button)
+        button_layout.addStretch()
+        button_layout.addWidget(close_button)
+
+        layout.addWidget(self.rules_table)
+        layout.addLayout(form_layout)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    ''' Marks the dialog closed before it is deleted, so database results arriving later are ignored. '''
+    def done(self, result):
+        self.closed = True
+        super().done(result)
+
+    ''' Shows the RRULE input for custom rules and the interval input otherwise. '''
+    def update_rule_inputs(self):
+        custom = self.frequency_input.currentText() == self.CUSTOM
+        self.rule_input.setEnabled(custom)
+        self.interval_input.setEnabled(not custom)
+
+    def load_rules(self):
+        self.service.read(user_rules, self.user_id, callback=self.rules_loaded, cancelled=lambda: self.closed)
+
+    def rules_loaded(self, rules):
+        if self.closed:
+            return
+        self.rules = rules
+        self.rules_table.setRowCount(len(rules))
+        for row_number, (_, name, cost_cents, frequency, interval, until_date, max_count, next_due) in enumerate(rules):
+            self.rules_table.setItem(row_number, 0, QTableWidgetItem(name))
+            self.rules_table.setItem(row_number, 1, QTableWidgetItem(display_cents(cost_cents)))
+            self.rules_table.setItem(
+                row_number, 2, QTableWidgetItem(describe_rule(frequency, interval, until_date, max_count))
+            )
+            self.rules_table.setItem(row_number, 3, QTableWidgetItem(display_date(next_due) if next_due else "Ended"))
+        self.delete_button.setEnabled(False)
+
+    ''' Validates the form, then adds the rule and any of its occurrences that are already due. '''
+    @timed("recurring.add_rule")
+    def add_rule(self):
+        name = self.name_input.text().strip()
+        if not name or not self.cost_input.text().strip():
+            QMessageBox.warning(self, "Input Error", "Please enter both expense name and cost!")
+            return
+        try:
+            cost_cents = parse_cents(self.cost_input.text())
+        except ValueError:
+            QMessageBox.warning(self, "Input Error", "Please enter a valid cost!")
+            return
+        until_date = None
+        max_count = None
+        if self.frequency_input.currentText() == self.CUSTOM:
+            try:
+                frequency, interval, until_date, max_count = parse_rule(self.rule_input.text())
+            except ValueError as e:
+                QMessageBox.warning(self, "Input Error", f"Invalid rule: {e}")
+                return
+        else:
+            frequency = FREQUENCIES[self.frequency_input.currentIndex()]
+            interval = self.interval_input.value()
+        if self.until_enabled.isChecked():
+            until_date = self.until_date_input.date().toString("yyyy-MM-dd")
+        self.add_button.setEnabled(False)
+        self.service.write(
+            add_rule_and_materialize, date.today().isoformat(), self.user_id, name, cost_cents,
+            self.description_input.text().strip(), frequency, interval,
+            self.start_date_input.date().toString("yyyy-MM-dd"), until_date, max_count,
+            callback=self.rule_added, error_callback=self.write_failed
+        )
+
+    ''' Reports the expenses added with a new rule, then clears the form if the dialog is still open.
+
+        :param added: A dict of the number of expenses added per user ID. '''
+    def rule_added(self, added):
+        if added:
+            self.materialized_callback(added)
+        if self.closed:
+            return
+        self.add_button.setEnabled(True)
+        self.name_input.clear()
+        self.cost_input.clear()
+        self.description_input.clear()
+        self.rule_input.clear()
+        self.load_rules()
+
+    def delete_rule(self):
+        row = self.rules_table.currentRow()
+        if row < 0 or row >= len(self.rules):
+            return
+        reply = QMessageBox.question(
+            self, "Delete Recurring Expense",
+            "Stop repeating this expense? Expenses it already added are kept.",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        self.service.write(
+            delete_rule, self.user_id, self.rules[row][0],
+            callback=lambda _: self.load_rules(), error_callback=self.write_failed
+        )
+
+    def write_failed(self, error):
+        if self.closed:
+            return
+        self.add_button.setEnabled(True)
+        QMessageBox.warning(self, "Database Error", f"Could not save the recurring expense: {error}")
@@ -0,0 +1,192 @@
+from archive import archive_horizon, archive_tables_between
+from expense_query import ExpenseFilter, SORT_COLUMNS
+
+# Table column number of the expense date, the default sort.
+DATE_COLUMN = 3
+
+''' One page of expenses, with the cursors to continue from either end of it.
+    A cursor is the tuple of sort key values of a row, so it keeps pointing at the same place
+    when expenses are added or removed elsewhere, unlike an OFFSET. '''
+class Page:
+    def __init__(self, rows, first_cursor, last_cursor, has_previous, has_next):
+        self.rows = rows
+        self.first_cursor = first_cursor
+        self.last_cursor = last_cursor
+        self.has_previous = has_previous
+        self.has_next = has_next
+
+''' Keyset-paginated reads of one user's expenses, optionally filtered.
+    Rows are ordered by the sort column and then by id, and each page continues from a cursor
+    with a row-value comparison that the per-user sort indexes answer with a single seek, so a
+    page deep into a user's history costs the same as the first one.
+    Archived years are only read when the filter has a start date in or before them, or when
+    include_archived is set, so everyday reads only touch the 'expenses' table. That table holds
+    every expense that isn't archived, including ones dated before the archive horizon (see
+    archive.py) that were added later. Archive tables are merged in with UNION ALL in the same order.
+    A repository holds no connection and is never changed, so it can be handed to
+    DatabaseService jobs; its methods take the connection as their first argument. '''
+class ExpenseRepository:
+
+    """ Initializes the ExpenseRepository instance.
+
+        :param user_id: The ID of the user whose expenses are read.
+        :param expense_filter: An ExpenseFilter, or None for all of the user's expenses.
+        :param sort_column: Table column number to order by, one of SORT_COLUMNS. Defaults to the date.
+        :param descending: Whether to order from the highest key to the lowest.
+        :param page_size: Number of rows per page.
+        :param include_archived: Whether to read archived expenses even without a start date,
+            as an export of everything does. """
+    def __init__(
+        self, user_id, expense_filter=None, sort_column=DATE_COLUMN, descending=False, page_size=256,
+        include_archived=False
+    ):
+        if sort_column not in SORT_COLUMNS:
+            raise ValueError(f"Expenses can't be sorted by column {sort_column}")
+        self.user_id = user_id
+        self.expense_filter = expense_filter or ExpenseFilter()
+        self.sort_column = sort_column
+        self.descending = descending
+        self.page_size = page_size
+        self.include_archived = include_archived
+        # The sort column, then id as a tie-breaker so every row has a unique position.
+        self.key_columns = (0,) if sort_column == 0 else (sort_column, 0)
+
+    ''' Returns the cursor of a (id, name, cost_cents, date, description) row. '''
+    def cursor(self, row):
+        return tuple(row[column] for column in self.key_columns)
+
+    def first_page(self, conn):
+        return self._read(conn, None, backward=False)
+
+    def last_page(self, conn):
+        return self._read(conn, None, backward=True)
+
+    ''' Returns the page of rows that follow a cursor. '''
+    def page_after(self, conn, cursor):
+        return self._read(conn, cursor, backward=False)
+
+    ''' Returns the page of rows that precede a cursor. '''
+    def page_before(self, conn, cursor):
+        return self._read(conn, cursor, backward=True)
+
+    ''' Yields every matching row in order, one page at a time. '''
+    def iter_rows(self, conn):
+        page = self.first_page(conn)
+        while page.rows:
+            yield from page.rows
+            if not page.has_next:
+                break
+            page = self.page_after(conn, page.last_cursor)
+
+    ''' Returns whether an expense in the 'expenses' table is one of the rows this repository reads,
+        using one indexed lookup. '''
+    def matches(self, conn, expense_id):
+        _, where, params = self._sources(conn)[0]
+        c = conn.cursor()
+        c.execute(f"SELECT 1 FROM expenses {where} AND id=?", params + [expense_id])
+        return c.fetchone() is not None
+
+    ''' Returns the number of matching expenses and their total cost in cents.
+        Without a filter both come from the monthly summary table, in O(months). '''
+    def totals(self, conn):
+        c = conn.cursor()
+        if not self.expense_filter.is_empty():
+            sql, params = self._union(conn, "cost_cents")
+            c.execute(f"SELECT COUNT(*), COALESCE(SUM(cost_cents), 0) FROM ({sql})", params)
+            return c.fetchone()
+        horizon = None if self.include_archived else archive_horizon(c)
+        # The summaries count archived expenses too, so without the archives only the months from
+        # the horizon on are added, as those have no archived expenses.
+        month = horizon[:7] if horizon else ""
+        c.execute(
+            "SELECT COALESCE(SUM(expense_count), 0), COALESCE(SUM(total_cents), 0) "
+            "FROM expense_monthly_totals WHERE user_id=? AND month>=?",
+            (self.user_id, month)
+        )
+        count, total = c.fetchone()
+        if horizon is not None:
+            # Expenses dated before the horizon that are still in 'expenses' are added directly.
+            # There are few of them, and the (user_id, date) index finds them without the archives.
+            c.execute(
+                "SELECT COUNT(*), COALESCE(SUM(cost_cents), 0) FROM expenses WHERE user_id=? AND date<?",
+                (self.user_id, month)
+            )
+            earlier_count, earlier_total = c.fetchone()
+            count, total = count + earlier_count, total + earlier_total
+        return count, total
+
+    ''' Returns an upper bound on the number of matching expenses from the monthly summary table,
+        in O(months). It counts every expense in the months the date range touches, archived or
+        not, so it is exact for all of a user's expenses and never scans the expenses themselves. '''
+    def approximate_count(self, conn):
+        c = conn.cursor()
+        conditions = ["user_id=?"]
+        params = [self.user_id]
+        if self.expense_filter.date_from is not None:
+            conditions.append("month>=?")
+            params.append(self.expense_filter.date_from[:7])
+        if self.expense_filter.date_to is not None:
+            conditions.append("month<=?")
+            params.append(self.expense_filter.date_to[:7])
+        c.execute(
+            f"SELECT COALESCE(SUM(expense_count), 0) FROM expense_monthly_totals WHERE {' AND '.join(conditions)}",
+            params
+        )
+        return c.fetchone()[0]
+
+    ''' Returns the tables to read as a list of (table, where, params), 'expenses' first and then
+        any archive tables the date range reaches. Without a start date no archive is read, unless
+        include_archived is set. '''
+    def _sources(self, conn):
+        where, params = self.expense_filter.where_clause(self.user_id)
+        sources = [("expenses", where, params)]
+        date_from = self.expense_filter.date_from
+        if date_from is None and not self.include_archived:
+            return sources
+        archived_where, archived_params = self.expense_filter.where_clause(self.user_id, full_text=False)
+        for table in archive_tables_between(conn.cursor(), date_from, self.expense_filter.date_to):
+            sources.append((table, archived_where, list(archived_params)))
+        return sources
+
+    ''' Returns a query for the given columns of the matching rows of every table to read.
+
+        :param condition: Extra SQL condition for each table, such as a cursor comparison.
+        :return: Tuple of (sql, params). '''
+    def _union(self, conn, columns, condition="", condition_params=()):
+        selects = []
+        params = []
+        for table, where, where_params in self._sources(conn):
+            selects.append(f"SELECT {columns} FROM {table} {where}{condition}")
+            params += where_params + list(condition_params)
+        return " UNION ALL ".join(selects), params
+
+    def _read(self, conn, cursor, backward):
+        key_names = [SORT_COLUMNS[column] for column in self.key_columns]
+        # Reading backward walks the index in the opposite direction and flips the rows afterwards.
+        ascending = self.descending == backward
+        condition = ""
+        if cursor is not None:
+            placeholders = ", ".join("?" for _ in key_names)
+            condition = f" AND ({', '.join(key_names)}) {'>' if ascending else '<'} ({placeholders})"
+        sql, params = self._union(conn, "id, name, cost_cents, date, description", condition, cursor or ())
+        direction = "ASC" if ascending else "DESC"
+        order_by = ", ".join(f"{name} {direction}" for name in key_names)
+        c = conn.cursor()
+        # One extra row tells whether another page follows without a separate query. With archive
+        # tables, SQLite merges the separately ordered selects instead of sorting their union.
+        c.execute(f"{sql} ORDER BY {order_by} LIMIT ?", params + [self.page_size + 1])
+        rows = c.fetchall()
+        more = len(rows) > self.page_size
+        del rows[self.page_size:]
+        if backward:
+            rows.reverse()
+            has_previous, has_next = more, cursor is not None
+        else:
+            has_previous, has_next = cursor is not None, more
+        return Page(
+            rows,
+            self.cursor(rows[0]) if rows else cursor,
+            self.cursor(rows[-1]) if rows else cursor,
+            has_previous,
+            has_next,
+        )
@@ -0,0 +1,122 @@
+''' Multi-process stress test for a database shared by several running trackers.
+
+    Starts N client processes at once, each with its own DatabaseService in shared mode, which add
+    expenses through the write queue while paging through them, and prints the write and read
+    throughput for each client count and write batch size as JSON:
+
+        python stress.py --clients 1 2 4 8 --writes 2000
+
+    By default every client count is run with --max-batch 1, which commits each write on its own,
+    and with group commit, so the two can be compared. '''
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import deque
+from benchmark import BENCH_PASSWORD, generate_expenses, summarize
+from database import init_db
+from db_service import DatabaseService
+from passwords import hash_password
+from repository import ExpenseRepository
+
+def _add_expense(conn, row):
+    conn.execute("INSERT INTO expenses (user_id, name, cost_cents, date, description) VALUES (?, ?, ?, ?, ?)", row)
+
+''' Runs one simulated client and puts its results on a queue. Runs in its own process.
+
+    :param in_flight: Writes a client keeps queued at once, as during an import or a burst of edits.
+    :param read_every: Number of writes between reads of the first page of the client's expenses. '''
+def run_client(db_path, user_id, writes, in_flight, read_every, max_batch, barrier, results):
+    service = DatabaseService(db_path, read_workers=1, shared=True, max_batch=max_batch)
+    repository = ExpenseRepository(user_id)
+    rows = generate_expenses(1, writes, seed=user_id)
+    latencies = []
+    pending = deque()
+    errors = 0
+    reads = 0
+    barrier.wait()
+    started = time.time()
+    for number, (_, name, cost_cents, date, description) in enumerate(rows, start=1):
+        submitted = time.perf_counter()
+        future = service.write(_add_expense, (user_id, name, cost_cents, date, description))
+        future.add_done_callback(lambda f, submitted=submitted: latencies.append(time.perf_counter() - submitted))
+        pending.append(future)
+        if len(pending) >= in_flight:
+            errors += pending.popleft().exception() is not None
+        if number % read_every == 0:
+            service.read(repository.first_page).result()
+            reads += 1
+    while pending:
+        errors += pending.popleft().exception() is not None
+    finished = time.time()
+    service.shutdown()
+    results.put({"started": started, "finished": finished, "reads": reads, "errors": errors, "latencies": latencies})
+
+''' Runs `clients` client processes against the database together and returns their combined throughput. '''
+def run_round(context, db_path, clients, writes, in_flight, read_every, max_batch):
+    barrier = context.Barrier(clients)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=run_client,
+            args=(db_path, user_id, writes, in_flight, read_every, max_batch, barrier, results)
+        )
+        for user_id in range(1, clients + 1)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    seconds = max(o["finished"] for o in outcomes) - min(o["started"] for o in outcomes)
+    return {
+        "clients": clients,
+        "max_batch": max_batch,
+        "seconds": seconds,
+        "writes": clients * writes,
+        "writes_per_second": clients * writes / seconds,
+        "reads_per_second": sum(o["reads"] for o in outcomes) / seconds,
+        "errors": sum(o["errors"] for o in outcomes),
+        "write_latency": summarize([latency for o in outcomes for latency in o["latencies"]]),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress a shared expense tracker database with several processes.")
+    parser.add_argument("--db", help="Database file to use. Defaults to a temporary file.")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8], help="Client process counts to run.")
+    parser.add_argument("--writes", type=int, default=2000, help="Expenses each client adds per round.")
+    parser.add_argument("--in-flight", type=int, default=16, help="Writes each client keeps queued at once.")
+    parser.add_argument("--read-every", type=int, default=10, help="Writes between each client's page reads.")
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[1, 256], help="Write batch sizes to compare.")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="expense-stress-"), "expense_tracker.db")
+    conn = init_db(db_path)
+    password = hash_password(BENCH_PASSWORD)
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
+        [(f"user{i}", password) for i in range(1, max(args.clients) + 1)]
+    )
+    conn.commit()
+    conn.close()
+
+    # Spawned processes start clean on every platform, without a copy of this process's state.
+    context = multiprocessing.get_context("spawn")
+    rounds = [
+        run_round(context, db_path, clients, args.writes, args.in_flight, args.read_every, max_batch)
+        for max_batch in args.max_batch
+        for clients in args.clients
+    ]
+    output = json.dumps({"database": db_path, "rounds": rounds}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
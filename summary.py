@@ -0,0 +1,96 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QHeaderView, QPushButton
+)
+from PyQt5.QtCore import Qt
+from profiling import timed
+from formatting import display_cents, display_month
+
+''' Returns a user's (month, expense count, total cents) rows, newest month first. '''
+def monthly_totals(conn, user_id):
+    c = conn.cursor()
+    c.execute(
+        "SELECT month, expense_count, total_cents FROM expense_monthly_totals WHERE user_id=? ORDER BY month DESC",
+        (user_id,)
+    )
+    return c.fetchall()
+
+''' Returns a user's (name, expense count, total cents) rows, highest total first. '''
+def name_totals(conn, user_id, limit=50):
+    c = conn.cursor()
+    c.execute(
+        "SELECT name, expense_count, total_cents FROM expense_name_totals WHERE user_id=? "
+        "ORDER BY total_cents DESC LIMIT ?",
+        (user_id, limit)
+    )
+    return c.fetchall()
+
+''' A dialog summarizing a user's spending per month and per expense name.
+    It reads the precomputed summary tables, so opening it costs O(months) regardless of ledger size. '''
+class SummaryDialog(QDialog):
+    def __init__(self, service, user_id, parent=None):
+        super().__init__(parent)
+        self.service = service
+        self.user_id = user_id
+        self.monthly_table = None
+        self.names_table = None
+        self.closed = False
+        self.setWindowTitle("Expense Summary")
+        self.resize(700, 450)
+        self.init_ui()
+        self.load_summary()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        tables_layout = QHBoxLayout()
+        self.monthly_table = self.create_table(["Month", "Expenses", "Total"])
+        self.names_table = self.create_table(["Name", "Expenses", "Total"])
+        monthly_layout = QVBoxLayout()
+        monthly_layout.addWidget(QLabel("Spending by Month:"))
+        monthly_layout.addWidget(self.monthly_table)
+        names_layout = QVBoxLayout()
+        names_layout.addWidget(QLabel("Top Expenses by Name:"))
+        names_layout.addWidget(self.names_table)
+        tables_layout.addLayout(monthly_layout)
+        tables_layout.addLayout(names_layout)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.accept)
+        layout.addLayout(tables_layout)
+        layout.addWidget(close_button, alignment=Qt.AlignRight)
+        self.setLayout(layout)
+
+    ''' Marks the dialog closed before it is deleted, so database results arriving later are ignored. '''
+    def done(self, result):
+        self.closed = True
+        super().done(result)
+
+    def create_table(self, headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        return table
+
+    ''' Reads both summaries on the database service and fills the tables when they arrive. '''
+    def load_summary(self):
+        self.service.read(monthly_totals, self.user_id, callback=self.months_loaded, cancelled=lambda: self.closed)
+        self.service.read(name_totals, self.user_id, callback=self.names_loaded, cancelled=lambda: self.closed)
+
+    @timed("summary.months_loaded")
+    def months_loaded(self, rows):
+        if self.closed:
+            return
+        self.fill_table(self.monthly_table, [(display_month(month), count, total) for month, count, total in rows])
+
+    @timed("summary.names_loaded")
+    def names_loaded(self, rows):
+        if self.closed:
+            return
+        self.fill_table(self.names_table, rows)
+
+    def fill_table(self, table, rows):
+        table.setRowCount(len(rows))
+        for row_number, (label, count, total) in enumerate(rows):
+            table.setItem(row_number, 0, QTableWidgetItem(label))
+            table.setItem(row_number, 1, QTableWidgetItem(str(count)))
+            table.setItem(row_number, 2, QTableWidgetItem(display_cents(total)))